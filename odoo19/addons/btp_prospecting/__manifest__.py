@@ -66,6 +66,9 @@ Module 3 - Quotes & Articles:
         'security/ir.model.access.csv',
         'data/btp_lead_stage_data.xml',
         'data/btp_lead_reminder_cron.xml',
+        'data/btp_lead_duplicate_cron.xml',
+        'data/btp_partner_enrichment_cron.xml',
+        'data/btp_sirene_import_cron.xml',
         'data/btp_document_expiration_cron.xml',
         'data/btp_quote_sequence.xml',
         'data/btp_quote_item_product.xml',
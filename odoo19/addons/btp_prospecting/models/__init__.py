@@ -1,17 +1,28 @@
 # -*- coding: utf-8 -*-
 
 from . import btp_lead
+from . import btp_lead_duplicate
 from . import btp_lead_stage
+from . import btp_notification_outbox
+from . import btp_activity_scheduler
+from . import mail_activity
 from . import res_users
+from . import btp_user_hierarchy
 from . import res_partner
+from . import btp_dedup_key
 from . import btp_company_hierarchy
 from . import btp_contact_career
 from . import btp_company_api
+from . import btp_company_api_cache
+from . import btp_company_api_quota
+from . import btp_company_search
+from . import btp_sirene_importer
 from . import btp_company_address
 from . import btp_company_site
 from . import btp_company_commercial_condition
 from . import btp_company_reattribution
 # Module 3 - Quotes & Articles
+from . import btp_document_expiry_mixin
 from . import btp_article_family
 from . import btp_article_document
 from . import btp_article_price_history
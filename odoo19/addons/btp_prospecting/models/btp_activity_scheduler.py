@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools import SQL
+from collections import defaultdict
+
+
+class BtpActivityScheduler(models.AbstractModel):
+    """Bulk activity scheduling for the BTP crons
+
+    Activities are given as ``mail.activity`` values; those carrying a
+    ``btp_dedup_key`` are skipped when an open activity with the same key
+    already exists on the same record (or an open automated activity of the
+    same type without key, scheduled before the keys existed). Existing keys
+    are resolved with one query and the missing activities are created in
+    one batch.
+    """
+    _name = 'btp.activity.scheduler'
+    _description = 'BTP Bulk Activity Scheduler'
+
+    @api.model
+    def schedule(self, vals_list):
+        """Create the activities of ``vals_list`` that do not exist yet
+
+        :param vals_list: ``mail.activity`` values, with ``res_model`` (model
+            name) instead of ``res_model_id`` and an optional ``btp_dedup_key``
+        :return: the created activities
+        """
+        Activity = self.env['mail.activity']
+        keyed = [vals for vals in vals_list if vals.get('btp_dedup_key')]
+        seen = set()
+        if keyed:
+            Activity.flush_model(['res_model', 'res_id', 'btp_dedup_key', 'active'])
+            self.env.cr.execute(SQL(
+                """
+                SELECT a.res_model, a.res_id, a.btp_dedup_key
+                  FROM mail_activity a
+                  JOIN unnest(%s::varchar[], %s::int[], %s::varchar[]) AS n(res_model, res_id, dedup_key)
+                    ON a.btp_dedup_key = n.dedup_key
+                   AND a.res_id = n.res_id
+                   AND a.res_model = n.res_model
+                 WHERE a.active
+                """,
+                [vals['res_model'] for vals in keyed],
+                [vals['res_id'] for vals in keyed],
+                [vals['btp_dedup_key'] for vals in keyed],
+            ))
+            seen.update(self.env.cr.fetchall())
+            self._adopt_unkeyed_activities([
+                vals for vals in keyed
+                if (vals['res_model'], vals['res_id'], vals['btp_dedup_key']) not in seen
+            ], seen)
+
+        IrModel = self.env['ir.model']
+        create_vals_list = []
+        for vals in vals_list:
+            key = (vals['res_model'], vals['res_id'], vals.get('btp_dedup_key'))
+            if key[2]:
+                if key in seen:
+                    continue
+                seen.add(key)
+            create_vals = dict(vals, res_model_id=IrModel._get_id(vals['res_model']))
+            create_vals.pop('res_model')
+            create_vals_list.append(create_vals)
+        return Activity.create(create_vals_list)
+
+    @api.model
+    def _adopt_unkeyed_activities(self, vals_list, seen):
+        """Match keyed values with open automated activities scheduled before the keys existed
+
+        An open automated activity of the same type on the same record, and
+        without key, stands for one of the keyed activities: it receives its
+        key instead of being duplicated. Matched keys are added to ``seen``.
+        """
+        if not vals_list:
+            return
+        self.env.cr.execute(SQL(
+            """
+            SELECT DISTINCT a.id, a.res_model, a.res_id, a.activity_type_id
+              FROM mail_activity a
+              JOIN unnest(%s::varchar[], %s::int[], %s::int[]) AS n(res_model, res_id, activity_type_id)
+                ON a.res_id = n.res_id
+               AND a.res_model = n.res_model
+               AND a.activity_type_id = n.activity_type_id
+             WHERE a.active
+               AND a.automated
+               AND a.btp_dedup_key IS NULL
+          ORDER BY a.id
+            """,
+            [vals['res_model'] for vals in vals_list],
+            [vals['res_id'] for vals in vals_list],
+            [vals.get('activity_type_id') for vals in vals_list],
+        ))
+        unkeyed = defaultdict(list)
+        for activity_id, res_model, res_id, activity_type_id in self.env.cr.fetchall():
+            unkeyed[res_model, res_id, activity_type_id].append(activity_id)
+
+        adopted = defaultdict(list)
+        for vals in vals_list:
+            key = (vals['res_model'], vals['res_id'], vals['btp_dedup_key'])
+            activity_ids = unkeyed.get((vals['res_model'], vals['res_id'], vals.get('activity_type_id')))
+            if key in seen or not activity_ids:
+                continue
+            adopted[vals['btp_dedup_key']].append(activity_ids.pop(0))
+            seen.add(key)
+        Activity = self.env['mail.activity'].sudo()
+        for dedup_key, activity_ids in adopted.items():
+            Activity.browse(activity_ids).write({'btp_dedup_key': dedup_key})
@@ -2,6 +2,8 @@
 
 from odoo import models, fields
 
+from .btp_company_hierarchy import create_identifier_unique_index
+
 
 class BtpCompanyAddress(models.Model):
     _name = 'btp.company.address'
@@ -27,6 +29,8 @@ class BtpCompanyAddress(models.Model):
         default='hq'
     )
     name = fields.Char(string='Label')
+    siret = fields.Char(string='SIRET', size=14,
+                        help='14-digit SIRET number of the establishment at this address')
     street = fields.Char(string='Street')
     street2 = fields.Char(string='Street 2')
     city = fields.Char(string='City')
@@ -37,3 +41,5 @@ class BtpCompanyAddress(models.Model):
     email = fields.Char(string='Email')
     active = fields.Boolean(default=True)
 
+    def init(self):
+        create_identifier_unique_index(self.env.cr, 'btp_company_address_siret_unique', self._table, 'siret')
@@ -2,7 +2,11 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
+import threading
+import time
 
 _logger = logging.getLogger(__name__)
 
@@ -14,132 +18,373 @@ except ImportError:
     _logger.warning('requests library not available. API enrichment will be disabled.')
 
 
+# (connect, read) timeouts of provider calls, in seconds
+PROVIDER_TIMEOUT = (3.05, 10)
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_SECONDS = 60
+RATE_LIMIT_MAX_WAIT = 5
+# Requests per minute allowed by default (INSEE Sirene API quota: 30 per minute)
+DEFAULT_RATE_LIMITS = {'insee': 30, 'pappers': 120, 'infogreffe': 60}
+
+
+class CircuitBreaker:
+    """Stop calling a failing provider, and probe it again after a cooldown
+
+    Closed, calls go through. After ``failure_threshold`` consecutive
+    failures it opens and refuses calls for ``reset_seconds``; then a single
+    trial call is let through, which closes it on success or reopens it.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.trial_running = True
+            return True
+
+    def is_open(self):
+        """Return whether calls are refused for now, without taking the trial call"""
+        with self.lock:
+            return self.opened_at is not None and (
+                self.trial_running or time.monotonic() - self.opened_at < self.reset_seconds
+            )
+
+    def cancel(self):
+        """Give back a call allowed by ``allow`` but not made"""
+        with self.lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class TokenBucket:
+    """Rate limiter keeping any 60 s window within ``rate_per_minute`` calls
+
+    Bursts of a tenth of the quota are allowed; the bucket then refills at
+    the remaining rate.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = max(rate_per_minute // 10, 1)
+        self.refill_rate = max(rate_per_minute - self.capacity, 1) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        """Take a token, waiting at most ``max_wait`` seconds; return False on timeout"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.refill_rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# Shared by the threads of a worker: breakers and buckets per (db name, provider),
+# one pooled HTTP session per thread
+_transport_lock = threading.Lock()
+_breakers = {}
+_buckets = {}
+_thread_local = threading.local()
+
+
+def get_http_session():
+    """Return the pooled (keep-alive) HTTP session of the current thread"""
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _thread_local.session = session
+    return session
+
+
+def fetch_json(provider, breaker, bucket, request):
+    """GET ``request`` (url, headers, params) through the breaker and rate limiter of ``provider``
+
+    Does not use the environment, so that it can run on a thread pool.
+
+    :return: ('ok', decoded JSON), ('not_found', None) or ('error', None)
+    """
+    url, headers, params = request
+    if not breaker.allow():
+        _logger.info('Skipping %s enrichment: circuit breaker is open', provider)
+        return 'error', None
+    if not bucket.acquire():
+        breaker.cancel()
+        _logger.info('Skipping %s enrichment: rate limit reached', provider)
+        return 'error', None
+    try:
+        response = get_http_session().get(url, headers=headers, params=params, timeout=PROVIDER_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        breaker.record_failure()
+        _logger.error('%s API error: %s', provider, e)
+        return 'error', None
+    # Server errors and throttling open the breaker; 4xx answers prove the provider is up
+    if response.status_code >= 500 or response.status_code == 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if response.status_code == 404:
+        return 'not_found', None
+    try:
+        response.raise_for_status()
+        return 'ok', response.json()
+    except requests.exceptions.RequestException as e:
+        _logger.error('%s API error: %s', provider, e)
+        return 'error', None
+
+
 class BtpCompanyApiService(models.AbstractModel):
-    """Service for enriching company data from external APIs (INSEE, Pappers, Infogreffe)"""
+    """Service for enriching company data from external APIs (INSEE, Pappers, Infogreffe)
+
+    Provider calls share a pooled HTTP session per thread, and per provider a
+    circuit breaker (a provider that keeps failing is skipped at once, so the
+    fallback provider answers without waiting for timeouts) and a token
+    bucket pacing the calls of the worker. ``btp_prospecting.<provider>_rate_limit``
+    calls per minute are allowed to all the workers together, counted in
+    btp.company.api.quota.
+    """
     _name = 'btp.company.api.service'
     _description = 'BTP Company API Service'
 
     def enrich_from_pappers(self, siren):
         """
-        Enrich company data from Pappers API
+        Enrich company data from Pappers API (cached, see btp.company.api.cache)
         Note: Requires API key in system parameters
         """
-        if not REQUESTS_AVAILABLE:
-            _logger.warning('requests library not available')
-            return {}
-        
-        api_key = self.env['ir.config_parameter'].sudo().get_param('btp_prospecting.pappers_api_key', False)
-        if not api_key:
-            _logger.warning('Pappers API key not configured')
-            return {}
-        
-        try:
-            url = f'https://api.pappers.fr/v2/entreprise'
-            headers = {
-                'Authorization': f'Bearer {api_key}',
-                'Content-Type': 'application/json'
-            }
-            params = {'siren': siren}
-            
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('entreprise'):
-                return self._parse_pappers_data(data['entreprise'])
-        except requests.exceptions.RequestException as e:
-            _logger.error(f'Pappers API error: {e}')
-        except Exception as e:
-            _logger.error(f'Error parsing Pappers data: {e}')
-        
-        return {}
-    
+        return self._enrich('pappers', siren)
+
     def enrich_from_insee(self, siren):
         """
-        Enrich company data from INSEE API
+        Enrich company data from INSEE API (cached, see btp.company.api.cache)
         """
-        if not REQUESTS_AVAILABLE:
-            _logger.warning('requests library not available')
-            return {}
-        
-        try:
-            url = f'https://api.insee.fr/entreprises/sirene/v3/siren/{siren}'
-            headers = {
-                'Accept': 'application/json'
-            }
-            api_key = self.env['ir.config_parameter'].sudo().get_param('btp_prospecting.insee_api_key', False)
-            if api_key:
-                headers['Authorization'] = f'Bearer {api_key}'
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('uniteLegale'):
-                return self._parse_insee_data(data['uniteLegale'])
-        except requests.exceptions.RequestException as e:
-            _logger.error(f'INSEE API error: {e}')
-        except Exception as e:
-            _logger.error(f'Error parsing INSEE data: {e}')
-        
-        return {}
-    
+        return self._enrich('insee', siren)
+
     def enrich_from_infogreffe(self, siren):
         """
-        Enrich company data from Infogreffe API
+        Enrich company data from Infogreffe API (cached, see btp.company.api.cache)
         Note: May require authentication
         """
+        return self._enrich('infogreffe', siren)
+
+    def _enrich(self, provider, siren):
+        return self._enrich_many(provider, [siren])[siren] or {}
+
+    def _enrich_many(self, provider, sirens, max_workers=1, stats=None):
+        """Return {siren: values} from ``provider`` ({} when unknown, None on error)
+
+        :param stats: optional dict, incremented with the outcome of the SIRENs
+            actually fetched (cache hits are not counted)
+        """
+        def fetch_many(missing):
+            fetched = self._fetch_many(provider, missing, max_workers=max_workers)
+            if stats is not None:
+                stats['calls'] += len(fetched)
+                stats['not_found'] += sum(1 for status, _values in fetched.values() if status == 'not_found')
+                stats['errors'] += sum(1 for status, _values in fetched.values() if status == 'error')
+            return fetched
+
+        return self.env['btp.company.api.cache'].sudo()._get_or_fetch_many(provider, sirens, fetch_many)
+
+    # ========== Transport ==========
+
+    def _get_transport(self, provider):
+        """Return the (circuit breaker, token bucket) of ``provider`` for this database in this worker"""
+        rate = int(self.env['ir.config_parameter'].sudo().get_param(
+            f'btp_prospecting.{provider}_rate_limit', DEFAULT_RATE_LIMITS[provider]
+        ))
+        key = (self.env.cr.dbname, provider)
+        with _transport_lock:
+            breaker = _breakers.setdefault(key, CircuitBreaker())
+            bucket = _buckets.get(key)
+            if bucket is None or bucket.rate_per_minute != rate:
+                bucket = _buckets[key] = TokenBucket(rate)
+        return breaker, bucket
+
+    def _reserve_calls(self, provider, count, rate):
+        """Reserve ``count`` calls to ``provider`` in the quota shared by the workers
+
+        When the quota of the current minute is used up, waits for the next
+        one if it starts within ``RATE_LIMIT_MAX_WAIT`` seconds.
+
+        :return: the number of calls granted
+        """
+        Quota = self.env['btp.company.api.quota'].sudo()
+        granted = 0
+        while True:
+            reserved, wait = Quota._reserve(provider, count - granted, rate)
+            granted += reserved
+            if granted >= count or wait > RATE_LIMIT_MAX_WAIT:
+                return granted
+            time.sleep(wait)
+
+    def _fetch(self, provider, siren):
+        """Query ``provider``; return (status, values), status being 'found', 'not_found' or 'error'"""
+        return self._fetch_many(provider, [siren])[siren]
+
+    def _fetch_many(self, provider, sirens, max_workers=1):
+        """Query ``provider`` for ``sirens``; return {siren: (status, values)}
+
+        Requests are prepared, the calls reserved in the shared quota and
+        responses parsed in the calling thread; only the HTTP calls run on up
+        to ``max_workers`` threads.
+        """
         if not REQUESTS_AVAILABLE:
             _logger.warning('requests library not available')
-            return {}
+            return {siren: ('error', {}) for siren in sirens}
+        breaker, bucket = self._get_transport(provider)
+        prepare = getattr(self, f'_prepare_{provider}_request')
+        parse = getattr(self, f'_parse_{provider}_response')
+        result = {}
+        todo = []
+        for siren in sirens:
+            request = prepare(siren)
+            if request:
+                todo.append((siren, request))
+            else:
+                result[siren] = ('error', {})
+        if todo and breaker.is_open():
+            _logger.info('Skipping %s enrichment: circuit breaker is open', provider)
+            result.update((siren, ('error', {})) for siren, _request in todo)
+            return result
+        granted = self._reserve_calls(provider, len(todo), bucket.rate_per_minute) if todo else 0
+        if granted < len(todo):
+            _logger.info('Skipping %s %s enrichments: rate limit reached', len(todo) - granted, provider)
+            result.update((siren, ('error', {})) for siren, _request in todo[granted:])
+            todo = todo[:granted]
 
+        call = functools.partial(fetch_json, provider, breaker, bucket)
+        if max_workers > 1 and len(todo) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                responses = list(executor.map(call, [request for _siren, request in todo]))
+        else:
+            responses = [call(request) for _siren, request in todo]
+
+        for (siren, _request), (status, data) in zip(todo, responses):
+            if status != 'ok':
+                result[siren] = (status, {})
+                continue
+            try:
+                values = parse(data)
+            except Exception as e:
+                _logger.error('Error parsing %s data: %s', provider, e)
+                result[siren] = ('error', {})
+                continue
+            result[siren] = ('found' if values else 'not_found'), values
+        return result
+
+    # ========== Requests ==========
+
+    def _is_provider_configured(self, provider):
+        """Return whether ``provider`` can be queried (INSEE needs no configuration)"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        if provider == 'pappers':
+            return bool(ICP.get_param('btp_prospecting.pappers_api_key'))
+        if provider == 'infogreffe':
+            return bool(ICP.get_param('btp_prospecting.infogreffe_api_url'))
+        return True
+
+    def _prepare_pappers_request(self, siren):
+        """Return (url, headers, params) of a Pappers lookup, or None when not configured"""
+        api_key = self.env['ir.config_parameter'].sudo().get_param('btp_prospecting.pappers_api_key', False)
+        if not api_key:
+            _logger.warning('Pappers API key not configured')
+            return None
+        headers = {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        }
+        return 'https://api.pappers.fr/v2/entreprise', headers, {'siren': siren}
+
+    def _prepare_insee_request(self, siren):
+        """Return (url, headers, params) of an INSEE lookup"""
+        headers = {
+            'Accept': 'application/json'
+        }
+        api_key = self.env['ir.config_parameter'].sudo().get_param('btp_prospecting.insee_api_key', False)
+        if api_key:
+            headers['Authorization'] = f'Bearer {api_key}'
+        return f'https://api.insee.fr/entreprises/sirene/v3/siren/{siren}', headers, None
+
+    def _prepare_infogreffe_request(self, siren):
+        """Return (url, headers, params) of an Infogreffe lookup, or None when not configured"""
         api_key = self.env['ir.config_parameter'].sudo().get_param('btp_prospecting.infogreffe_api_key', False)
         api_url = self.env['ir.config_parameter'].sudo().get_param('btp_prospecting.infogreffe_api_url', False)
         if not api_url:
             _logger.warning('Infogreffe API URL not configured')
-            return {}
-
+            return None
         headers = {'Accept': 'application/json'}
         if api_key:
             headers['Authorization'] = f'Bearer {api_key}'
+        return api_url, headers, {'siren': siren}
 
-        try:
-            response = requests.get(api_url, headers=headers, params={'siren': siren}, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            # Minimal parsing; adjust mapping to your Infogreffe response format
-            result = {}
-            if data.get('name'):
-                result['name'] = data['name']
-            if data.get('siren'):
-                result['siren'] = str(data['siren']).zfill(9)
-            if data.get('siret'):
-                result['siret'] = str(data['siret']).zfill(14)
-            if data.get('naf'):
-                result['naf_code'] = data['naf']
-            if data.get('legal_form'):
-                result['legal_form'] = data['legal_form']
-            if data.get('capital'):
-                try:
-                    result['capital'] = float(data['capital'])
-                except (ValueError, TypeError):
-                    pass
-            if data.get('address'):
-                result['street'] = data['address']
-            if data.get('zip'):
-                result['zip'] = data['zip']
-            if data.get('city'):
-                result['city'] = data['city']
+    # ========== Responses ==========
 
-            return result
-        except requests.exceptions.RequestException as e:
-            _logger.error(f'Infogreffe API error: {e}')
-        except Exception as e:
-            _logger.error(f'Error parsing Infogreffe data: {e}')
+    def _parse_pappers_response(self, data):
+        return self._parse_pappers_data(data['entreprise']) if data.get('entreprise') else {}
+
+    def _parse_insee_response(self, data):
+        return self._parse_insee_data(data['uniteLegale']) if data.get('uniteLegale') else {}
+
+    def _parse_infogreffe_response(self, data):
+        """Parse Infogreffe API response"""
+        # Minimal parsing; adjust mapping to your Infogreffe response format
+        result = {}
+        if data.get('name'):
+            result['name'] = data['name']
+        if data.get('siren'):
+            result['siren'] = str(data['siren']).zfill(9)
+        if data.get('siret'):
+            result['siret'] = str(data['siret']).zfill(14)
+        if data.get('naf'):
+            result['naf_code'] = data['naf']
+        if data.get('legal_form'):
+            result['legal_form'] = data['legal_form']
+        if data.get('capital'):
+            try:
+                result['capital'] = float(data['capital'])
+            except (ValueError, TypeError):
+                pass
+        if data.get('address'):
+            result['street'] = data['address']
+        if data.get('zip'):
+            result['zip'] = data['zip']
+        if data.get('city'):
+            result['city'] = data['city']
+        return result
 
-        return {}
-    
     def _parse_pappers_data(self, data):
         """Parse Pappers API response"""
         result = {}
@@ -238,24 +483,43 @@ class BtpCompanyApiService(models.AbstractModel):
         Main method to enrich company data
         Tries multiple sources if first fails
         """
-        if source == 'pappers':
-            data = self.enrich_from_pappers(siren)
-            if data:
-                return data, 'pappers'
-            # Fallback to INSEE
-            data = self.enrich_from_insee(siren)
-            if data:
-                return data, 'insee'
-        elif source == 'insee':
-            data = self.enrich_from_insee(siren)
-            if data:
-                return data, 'insee'
-            # Fallback to Pappers
-            data = self.enrich_from_pappers(siren)
-            if data:
-                return data, 'pappers'
-        
-        return {}, 'manual'
+        data, found_source = self.enrich_companies([siren], source=source)[siren]
+        return data, found_source or 'manual'
+
+    def enrich_companies(self, sirens, source='pappers', max_workers=1, stats=None):
+        """Batch version of ``enrich_company``, provider calls spread over ``max_workers`` threads
+
+        :param stats: optional dict, incremented with {provider: {'calls', 'not_found', 'errors',
+            'skipped'}}: outcome of the API calls (cache hits excluded), and lookups
+            skipped because the provider is not configured
+        :return: {siren: (values, source)}; source is 'manual' when no provider
+            knows the SIREN, and False when a provider could not be reached
+            (providers that are not configured are skipped, not unreachable)
+        """
+        providers = {'pappers': ('pappers', 'insee'), 'insee': ('insee', 'pappers')}.get(source, ())
+        result = {}
+        remaining = list(dict.fromkeys(sirens))
+        unreachable = set()
+        for provider in providers:
+            if not remaining:
+                break
+            provider_stats = None
+            if stats is not None:
+                provider_stats = stats.setdefault(provider, {'calls': 0, 'not_found': 0, 'errors': 0, 'skipped': 0})
+            if not self._is_provider_configured(provider):
+                if provider_stats is not None:
+                    provider_stats['skipped'] += len(remaining)
+                continue
+            values_by_siren = self._enrich_many(provider, remaining, max_workers=max_workers, stats=provider_stats)
+            for siren, values in values_by_siren.items():
+                if values:
+                    result[siren] = (values, provider)
+                elif values is None:
+                    unreachable.add(siren)
+            remaining = [siren for siren in remaining if siren not in result]
+        for siren in remaining:
+            result[siren] = ({}, False if siren in unreachable else 'manual')
+        return result
 
 
 # API service is used by res.partner model (see res_partner.py)
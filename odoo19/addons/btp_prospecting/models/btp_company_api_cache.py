@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools
+from odoo.tools import SQL
+from odoo.tools.lru import LRU
+from psycopg2.extras import Json
+from datetime import timedelta, timezone
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_DAYS = 30
+DEFAULT_NEGATIVE_TTL_DAYS = 1
+# In-process layer in front of the table:
+# {(db name, generation, source, siren): (expiry timestamp, values)}
+_memory_cache = LRU(1024)
+
+
+class BtpCompanyApiCache(models.Model):
+    """Cached results of the company enrichment APIs, per (source, SIREN)
+
+    Found companies are kept ``btp_prospecting.api_cache_ttl_days`` days and
+    unknown SIRENs ``btp_prospecting.api_cache_negative_ttl_days`` days;
+    transport errors are never cached. An in-process LRU sits in front of the
+    table so that repeated lookups within a worker do not query it either;
+    its keys include the ``btp_prospecting.api_cache_generation`` parameter,
+    bumped when entries are unlinked, so that every worker drops them.
+    """
+    _name = 'btp.company.api.cache'
+    _description = 'BTP Company API Cache'
+    _log_access = False
+    _order = 'fetch_date desc'
+
+    source = fields.Selection([
+        ('insee', 'INSEE'),
+        ('pappers', 'Pappers'),
+        ('infogreffe', 'Infogreffe'),
+    ], string='Source', required=True)
+    siren = fields.Char(string='SIREN', required=True)
+    found = fields.Boolean(string='Found', help='False when the source does not know this SIREN')
+    payload = fields.Json(string='Enriched Values')
+    fetch_date = fields.Datetime(string='Fetched On', required=True)
+
+    def init(self):
+        tools.create_unique_index(self.env.cr, 'btp_company_api_cache_source_siren_index', self._table, ['source', 'siren'])
+
+    @api.model
+    def _get_ttl(self, found):
+        """Return the lifetime of a cache entry, in seconds"""
+        param, default = (
+            ('btp_prospecting.api_cache_ttl_days', DEFAULT_TTL_DAYS) if found
+            else ('btp_prospecting.api_cache_negative_ttl_days', DEFAULT_NEGATIVE_TTL_DAYS)
+        )
+        days = float(self.env['ir.config_parameter'].sudo().get_param(param, default))
+        return days * 86400
+
+    @api.model
+    def _get_memory_prefix(self):
+        """Return the (db name, generation) prefix of the in-process cache keys"""
+        generation = self.env['ir.config_parameter'].sudo().get_param('btp_prospecting.api_cache_generation', '0')
+        return self.env.cr.dbname, generation
+
+    @api.model
+    def _invalidate_memory_cache(self):
+        """Make the in-process entries of every worker unreachable
+
+        Setting the parameter invalidates the registry caches, which is
+        signaled to the other workers; they read the new generation from then on.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        generation = int(ICP.get_param('btp_prospecting.api_cache_generation', '0'))
+        ICP.set_param('btp_prospecting.api_cache_generation', str(generation + 1))
+
+    @api.model
+    def _get_or_fetch(self, source, siren, fetch):
+        """Return the enriched values of ``siren`` from ``source``, fetching them only when not cached
+
+        :param fetch: callable(siren) returning (status, values) with status
+            'found', 'not_found' or 'error'
+        :return: a copy of the values ({} when unknown or on error)
+        """
+        values = self._get_or_fetch_many(source, [siren], lambda sirens: {siren: fetch(siren) for siren in sirens})
+        return values[siren] or {}
+
+    @api.model
+    def _get_or_fetch_many(self, source, sirens, fetch_many):
+        """Batch version of ``_get_or_fetch``: cached SIRENs are read with one query
+
+        With the ``btp_api_cache_refresh`` context key, every SIREN is fetched.
+
+        :param fetch_many: callable(sirens) returning {siren: (status, values)}
+            for the SIRENs missing from the cache
+        :return: {siren: copy of the values, {} when unknown, None on error}
+        """
+        now = time.time()
+        prefix = self._get_memory_prefix()
+        result = {}
+        missing = []
+        # Refresh runs bypass the cache lookups, and update the entries
+        refresh = self.env.context.get('btp_api_cache_refresh')
+        for siren in dict.fromkeys(sirens):
+            cached = None if refresh else _memory_cache.get((*prefix, source, siren))
+            if cached and cached[0] > now:
+                result[siren] = dict(cached[1])
+            else:
+                missing.append(siren)
+
+        if missing and not refresh:
+            self.env.cr.execute(SQL(
+                "SELECT siren, found, payload, fetch_date FROM btp_company_api_cache WHERE source = %s AND siren = ANY(%s)",
+                source, missing,
+            ))
+            for siren, found, values, fetch_date in self.env.cr.fetchall():
+                expiry = fetch_date.replace(tzinfo=timezone.utc).timestamp() + self._get_ttl(found)
+                if expiry > now:
+                    _memory_cache[(*prefix, source, siren)] = (expiry, values or {})
+                    result[siren] = dict(values or {})
+            missing = [siren for siren in missing if siren not in result]
+
+        if missing:
+            fetched = []
+            for siren, (status, values) in fetch_many(missing).items():
+                if status == 'error':
+                    result[siren] = None
+                    continue
+                found = status == 'found'
+                values = values if found else {}
+                fetched.append((siren, found, values))
+                _memory_cache[(*prefix, source, siren)] = (now + self._get_ttl(found), values)
+                result[siren] = dict(values)
+            self._store(source, fetched)
+        return result
+
+    @api.model
+    def _store(self, source, entries):
+        """Upsert (siren, found, values) entries; concurrent enrichments of a SIREN must not fail"""
+        if not entries:
+            return
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO btp_company_api_cache (source, siren, found, payload, fetch_date)
+                 SELECT %s, siren, found, payload, %s
+                   FROM unnest(%s::varchar[], %s::bool[], %s::jsonb[]) AS e(siren, found, payload)
+            ON CONFLICT (source, siren)
+          DO UPDATE SET found = EXCLUDED.found, payload = EXCLUDED.payload, fetch_date = EXCLUDED.fetch_date
+            """,
+            source, fields.Datetime.now(),
+            [entry[0] for entry in entries],
+            [entry[1] for entry in entries],
+            [Json(entry[2]) for entry in entries],
+        ))
+        self.invalidate_model()
+
+    def unlink(self):
+        result = super().unlink()
+        self._invalidate_memory_cache()
+        return result
+
+    @api.autovacuum
+    def _gc_expired_entries(self):
+        """Drop the entries older than the longest TTL"""
+        max_age = max(self._get_ttl(True), self._get_ttl(False))
+        self.env.cr.execute(SQL(
+            "DELETE FROM btp_company_api_cache WHERE fetch_date < %s",
+            fields.Datetime.now() - timedelta(seconds=max_age),
+        ))
+        # In-process entries expire at the same date, no need to invalidate them
+        _logger.info('Removed %d expired company API cache entries', self.env.cr.rowcount)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools
+from odoo.tools import SQL
+
+
+class BtpCompanyApiQuota(models.Model):
+    """Calls made to each enrichment API during the current minute, by all workers
+
+    The token buckets of btp.company.api.service pace the calls of a worker;
+    this counter keeps the calls of all the workers of the database within
+    the quota of the provider.
+    """
+    _name = 'btp.company.api.quota'
+    _description = 'BTP Company API Quota'
+    _log_access = False
+
+    provider = fields.Selection([
+        ('insee', 'INSEE'),
+        ('pappers', 'Pappers'),
+        ('infogreffe', 'Infogreffe'),
+    ], string='Provider', required=True)
+    window_start = fields.Datetime(string='Minute', required=True)
+    call_count = fields.Integer(string='Calls')
+
+    def init(self):
+        tools.create_unique_index(self.env.cr, 'btp_company_api_quota_provider_index', self._table, ['provider'])
+
+    @api.model
+    def _reserve(self, provider, count, limit):
+        """Reserve up to ``count`` calls to ``provider``, ``limit`` calls being allowed per minute
+
+        The counter is updated in its own transaction, committed at once:
+        the reservation is visible to the other workers right away, and the
+        row is not kept locked while the calls are made.
+
+        :return: (number of calls granted, seconds until the next minute)
+        """
+        with self.env.registry.cursor() as cr:
+            cr.execute(SQL(
+                """
+                INSERT INTO btp_company_api_quota (provider, window_start, call_count)
+                VALUES (%(provider)s, date_trunc('minute', now() AT TIME ZONE 'UTC'), 0)
+                ON CONFLICT (provider) DO NOTHING
+                """,
+                provider=provider,
+            ))
+            cr.execute(SQL(
+                """
+                WITH current AS (
+                    SELECT provider,
+                           date_trunc('minute', now() AT TIME ZONE 'UTC') AS minute,
+                           CASE WHEN window_start = date_trunc('minute', now() AT TIME ZONE 'UTC')
+                                THEN call_count ELSE 0 END AS used
+                      FROM btp_company_api_quota
+                     WHERE provider = %(provider)s
+                       FOR UPDATE
+                )
+                UPDATE btp_company_api_quota quota
+                   SET window_start = current.minute,
+                       call_count = GREATEST(LEAST(current.used + %(count)s, %(limit)s), current.used)
+                  FROM current
+                 WHERE quota.provider = current.provider
+             RETURNING quota.call_count - current.used,
+                       EXTRACT(EPOCH FROM current.minute + INTERVAL '1 minute' - now() AT TIME ZONE 'UTC')
+                """,
+                provider=provider, count=count, limit=limit,
+            ))
+            granted, wait = cr.fetchone()
+        return granted, float(wait)
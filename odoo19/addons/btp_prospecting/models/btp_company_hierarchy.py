@@ -1,12 +1,94 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
 import logging
 
 _logger = logging.getLogger(__name__)
 
 
+def identifier_predicate(column, where='', alias=None):
+    """Return the predicate of the partial unique index on an identifier column
+
+    :param where: boolean column the index is also restricted to
+    :param alias: table alias qualifying the columns
+    """
+    def identifier(name):
+        return SQL.identifier(alias, name) if alias else SQL.identifier(name)
+
+    predicate = SQL("%s IS NOT NULL AND %s <> ''", identifier(column), identifier(column))
+    return SQL("%s AND %s", predicate, identifier(where)) if where else predicate
+
+
+def create_identifier_unique_index(cr, index_name, table, column, where=''):
+    """Create a partial unique index on an identifier column
+
+    The index is skipped with a warning when existing rows already share a
+    value, so that an upgrade does not fail on legacy duplicates.
+    """
+    if tools.index_exists(cr, index_name):
+        return
+    predicate = identifier_predicate(column, where)
+    cr.execute(SQL(
+        "SELECT %s FROM %s WHERE %s GROUP BY %s HAVING COUNT(*) > 1 LIMIT 1",
+        SQL.identifier(column), SQL.identifier(table), predicate, SQL.identifier(column),
+    ))
+    duplicate = cr.fetchone()
+    if duplicate:
+        _logger.warning(
+            'Unique index %s not created: %s.%s holds duplicates (e.g. %s)',
+            index_name, table, column, duplicate[0],
+        )
+        return
+    cr.execute(SQL(
+        "CREATE UNIQUE INDEX %s ON %s (%s) WHERE %s",
+        SQL.identifier(index_name), SQL.identifier(table), SQL.identifier(column), predicate,
+    ))
+
+
+def check_identifier_conflicts(model, column, label, entries, where=''):
+    """Raise a ValidationError naming every record that would share an identifier
+
+    One query per batch: the values about to be stored are matched against
+    each other and against the existing records (archived ones included).
+
+    :param entries: (value, record name, record id or False) about to be stored
+    :param where: extra predicate of the partial unique index on ``column``
+    """
+    holders = {}
+    for value, name, record_id in entries:
+        if value:
+            holders.setdefault(value, []).append((record_id, name))
+    if not holders:
+        return
+    model.flush_model()
+    model.env.cr.execute(SQL(
+        "SELECT id, %s FROM %s WHERE %s AND %s = ANY(%s) AND id != ALL(%s::int[])",
+        SQL.identifier(column),
+        SQL.identifier(model._table),
+        identifier_predicate(column, where),
+        SQL.identifier(column),
+        list(holders),
+        [record_id for value, name, record_id in entries if record_id],
+    ))
+    rows = model.env.cr.fetchall()
+    existing = model.sudo().with_context(active_test=False).browse([row[0] for row in rows])
+    names = {record.id: record.display_name for record in existing}
+    for record_id, value in rows:
+        holders[value].append((record_id, names[record_id]))
+    conflicts = [
+        '%s: %s' % (value, ', '.join(name or _('New record') for record_id, name in records))
+        for value, records in holders.items()
+        if len(records) > 1
+    ]
+    if conflicts:
+        raise ValidationError(_(
+            '%(label)s must be unique. Conflicting records:\n%(conflicts)s',
+            label=label, conflicts='\n'.join(conflicts),
+        ))
+
+
 class BtpCompanyGroup(models.Model):
     """Company Group - Top level of hierarchy (e.g., Bouygues Construction)"""
     _name = 'btp.company.group'
@@ -55,16 +137,22 @@ class BtpCompanyGroup(models.Model):
         for record in self:
             record.active = not record.active
     
-    @api.constrains('siren')
-    def _check_group_siren_unique(self):
-        for record in self:
-            if record.siren:
-                duplicate = self.sudo().search([
-                    ('id', '!=', record.id),
-                    ('siren', '=', record.siren),
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(_('SIREN must be unique.'))
+    def init(self):
+        create_identifier_unique_index(self.env.cr, 'btp_company_group_siren_unique', self._table, 'siren')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        check_identifier_conflicts(self, 'siren', _('SIREN'), [
+            (vals.get('siren'), vals.get('name'), False) for vals in vals_list
+        ])
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if vals.get('siren'):
+            check_identifier_conflicts(self, 'siren', _('SIREN'), [
+                (vals['siren'], record.display_name, record.id) for record in self
+            ])
+        return super().write(vals)
 
 
 class BtpCompanySubsidiary(models.Model):
@@ -124,16 +212,22 @@ class BtpCompanySubsidiary(models.Model):
         for record in self:
             record.active = not record.active
     
-    @api.constrains('siren')
-    def _check_subsidiary_siren_unique(self):
-        for record in self:
-            if record.siren:
-                duplicate = self.sudo().search([
-                    ('id', '!=', record.id),
-                    ('siren', '=', record.siren),
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(_('SIREN must be unique.'))
+    def init(self):
+        create_identifier_unique_index(self.env.cr, 'btp_company_subsidiary_siren_unique', self._table, 'siren')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        check_identifier_conflicts(self, 'siren', _('SIREN'), [
+            (vals.get('siren'), vals.get('name'), False) for vals in vals_list
+        ])
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if vals.get('siren'):
+            check_identifier_conflicts(self, 'siren', _('SIREN'), [
+                (vals['siren'], record.display_name, record.id) for record in self
+            ])
+        return super().write(vals)
 
 
 class BtpCompanyAgency(models.Model):
@@ -189,14 +283,20 @@ class BtpCompanyAgency(models.Model):
         for record in self:
             record.active = not record.active
     
-    @api.constrains('siret')
-    def _check_agency_siret_unique(self):
-        for record in self:
-            if record.siret:
-                duplicate = self.sudo().search([
-                    ('id', '!=', record.id),
-                    ('siret', '=', record.siret),
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(_('SIRET must be unique.'))
+    def init(self):
+        create_identifier_unique_index(self.env.cr, 'btp_company_agency_siret_unique', self._table, 'siret')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        check_identifier_conflicts(self, 'siret', _('SIRET'), [
+            (vals.get('siret'), vals.get('name'), False) for vals in vals_list
+        ])
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if vals.get('siret'):
+            check_identifier_conflicts(self, 'siret', _('SIRET'), [
+                (vals['siret'], record.display_name, record.id) for record in self
+            ])
+        return super().write(vals)
 
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools import SQL
+import logging
+import re
+
+from .btp_lead_duplicate import normalize_text
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_LIMIT = 10
+DEFAULT_SIMILARITY_THRESHOLD = 0.5
+# Shorter needles have too few trigrams: they are matched as name prefixes
+MIN_TRIGRAM_LENGTH = 3
+
+
+class BtpCompanySearchEngine(models.AbstractModel):
+    """Ranked company lookup by name or SIREN/SIRET
+
+    Identifiers are matched as prefixes of the SIREN or SIRET (pattern
+    indexes) and rank first; names are matched with pg_trgm word similarity
+    against ``btp_name_normalized`` (GIN index) and ranked by similarity.
+    Archived companies are ignored; access rights are not applied, so that
+    users can check whether a company already exists before creating it.
+    """
+    _name = 'btp.company.search.engine'
+    _description = 'BTP Company Search Engine'
+
+    @api.model
+    def _get_similarity_threshold(self):
+        return float(self.env['ir.config_parameter'].sudo().get_param(
+            'btp_prospecting.company_search_similarity_threshold', DEFAULT_SIMILARITY_THRESHOLD
+        ))
+
+    @api.model
+    def search_companies(self, name=None, identifier=None, domain=None, limit=DEFAULT_SEARCH_LIMIT):
+        """Return the best matching companies, best first (sudo recordset)
+
+        :param name: (part of) the company name
+        :param identifier: beginning of a SIREN or SIRET, spaces allowed
+        :param domain: optional extra conditions on the companies
+        """
+        Partner = self.env['res.partner'].sudo()
+        needle = normalize_text(name)
+        digits = re.sub(r'\D', '', identifier or '')
+        if not needle and not digits:
+            return Partner
+
+        if not self.env.registry.has_trigram:
+            return Partner.search(self._get_fallback_domain(needle, digits) + list(domain or []), limit=limit)
+
+        self.env.cr.execute(self._get_search_query(needle, digits, domain, limit))
+        return Partner.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _get_search_query(self, needle, digits, domain=None, limit=DEFAULT_SEARCH_LIMIT):
+        """Return the ranked UNION ALL query of ``search_companies`` (pg_trgm required)
+
+        :param needle: normalized name, see ``normalize_text``
+        :param digits: beginning of a SIREN or SIRET, digits only
+        """
+        Partner = self.env['res.partner'].sudo()
+        Partner.flush_model(['active', 'is_company', 'siren', 'siret', 'btp_name_normalized'])
+        where = SQL("p.active AND p.is_company")
+        if domain:
+            where = SQL("%s AND p.id IN %s", where, Partner._search(domain).subselect())
+        branches = []
+        if digits:
+            prefix = f'{digits}%'
+            if len(digits) <= 9:
+                branches.append(SQL(
+                    "SELECT p.id, 2.0 AS score FROM res_partner p WHERE %s AND p.siren LIKE %s",
+                    where, prefix,
+                ))
+            branches.append(SQL(
+                "SELECT p.id, 2.0 AS score FROM res_partner p WHERE %s AND p.siret LIKE %s",
+                where, prefix,
+            ))
+        if needle and len(needle) >= MIN_TRIGRAM_LENGTH:
+            self.env.cr.execute(SQL(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                str(self._get_similarity_threshold()),
+            ))
+            # Word similarity finds the needle inside longer names; full
+            # similarity breaks ties in favour of the closest names
+            branches.append(SQL(
+                """
+                SELECT p.id, word_similarity(%(needle)s, p.btp_name_normalized)
+                             + similarity(%(needle)s, p.btp_name_normalized) / 2 AS score
+                  FROM res_partner p
+                 WHERE %(where)s AND %(needle)s <%% p.btp_name_normalized
+                """,
+                needle=needle, where=where,
+            ))
+        elif needle:
+            branches.append(SQL(
+                "SELECT p.id, 1.0 AS score FROM res_partner p WHERE %s AND p.btp_name_normalized LIKE %s",
+                where, f'{needle}%',
+            ))
+
+        return SQL(
+            """
+            SELECT id
+              FROM (%s) candidates
+          GROUP BY id
+          ORDER BY MAX(score) DESC, id DESC
+             LIMIT %s
+            """,
+            SQL(" UNION ALL ").join(branches), limit,
+        )
+
+    @api.model
+    def _get_fallback_domain(self, needle, digits):
+        """ilike domain used when pg_trgm is not available on the database"""
+        conditions = []
+        if needle:
+            conditions.append(('btp_name_normalized', 'ilike', needle))
+        if digits:
+            conditions += [('siren', '=like', f'{digits}%'), ('siret', '=like', f'{digits}%')]
+        return [('is_company', '=', True)] + ['|'] * (len(conditions) - 1) + conditions
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools
+from odoo.tools import SQL
+from odoo.tools.mail import email_normalize
+import logging
+import re
+
+from .btp_lead_duplicate import address_head, normalize_text
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_COUNTRY_CALLING_CODE = '33'
+BACKFILL_BATCH_SIZE = 10000
+
+# Fields whose changes require the blocking keys of a record to be rebuilt
+LEAD_DEDUP_FIELDS = {'site_name', 'site_address', 'site_zip', 'partner_name', 'partner_phone', 'partner_email'}
+CONTACT_DEDUP_FIELDS = {'name', 'email', 'phone', 'mobile', 'is_company', 'company_type'}
+
+
+def normalize_phone(value, country_code=DEFAULT_COUNTRY_CALLING_CODE):
+    """Return the E.164 form of a phone number (French numbering by default)"""
+    if not value:
+        return False
+    number = re.sub(r'[^\d+]', '', value)
+    if number.startswith('+'):
+        digits = number[1:]
+    elif number.startswith('00'):
+        digits = number[2:]
+    elif number.startswith('0'):
+        digits = country_code + number[1:]
+    else:
+        digits = number
+    digits = re.sub(r'\D', '', digits)
+    # "+33 (0)6 ..." notation: drop the trunk prefix after the country code
+    if digits.startswith(country_code + '0'):
+        digits = country_code + digits[len(country_code) + 1:]
+    return f'+{digits}' if len(digits) >= 8 else False
+
+
+def normalize_email(value):
+    """Return the canonical (lowercased, normalized) form of an email address"""
+    return email_normalize(value) if value else False
+
+
+def lead_dedup_keys(site_name, site_address, site_zip, partner_name, phone, email):
+    """Return the set of (key_type, key_value) blocking keys of a lead"""
+    keys = {
+        ('site_name', normalize_text(site_name)),
+        ('address', normalize_text(address_head(site_address))),
+        ('phone', normalize_phone(phone)),
+        ('email', normalize_email(email)),
+    }
+    company = normalize_text(partner_name)
+    zip_code = ''.join((site_zip or '').split())
+    if company and zip_code:
+        keys.add(('company_zip', f'{company}|{zip_code}'))
+    return {(key_type, value) for key_type, value in keys if value}
+
+
+def contact_dedup_keys(name, email, phone, mobile):
+    """Return the set of (key_type, key_value) blocking keys of a contact"""
+    keys = {
+        ('name', normalize_text(name)),
+        ('email', normalize_email(email)),
+        ('phone', normalize_phone(phone)),
+        ('phone', normalize_phone(mobile)),
+    }
+    return {(key_type, value) for key_type, value in keys if value}
+
+
+class BtpDedupKey(models.Model):
+    """Persisted blocking keys for lead and contact duplicate detection
+
+    Every lead and contact owns a set of normalized keys (site name, address,
+    E.164 phone, canonical email, company name + zip, contact name) kept
+    current by the create/write hooks of ``btp.lead`` and ``res.partner``.
+    Duplicate lookups are indexed equality joins on (key_type, key_value).
+    """
+    _name = 'btp.dedup.key'
+    _description = 'BTP Duplicate Blocking Key'
+    _log_access = False
+
+    res_model = fields.Char(string='Model', required=True)
+    res_id = fields.Many2oneReference(string='Record ID', model_field='res_model', required=True)
+    key_type = fields.Selection([
+        ('site_name', 'Site Name'),
+        ('address', 'Address'),
+        ('phone', 'Phone (E.164)'),
+        ('email', 'Email'),
+        ('company_zip', 'Company Name + ZIP'),
+        ('name', 'Contact Name'),
+    ], string='Key Type', required=True)
+    key_value = fields.Char(string='Key Value', required=True)
+
+    def init(self):
+        cr = self.env.cr
+        tools.create_index(cr, 'btp_dedup_key_lookup_index', self._table, ['key_type', 'key_value', 'res_model'])
+        tools.create_index(cr, 'btp_dedup_key_record_index', self._table, ['res_model', 'res_id'])
+        cr.execute(SQL("SELECT 1 FROM btp_dedup_key LIMIT 1"))
+        if not cr.fetchone():
+            self._backfill_keys()
+
+    def _backfill_keys(self):
+        """Build the keys of all existing leads and contacts (installation/upgrade)
+
+        Reads raw columns so that it does not depend on the initialization
+        order of the other models; tables or columns that do not exist yet
+        hold no data to index.
+        """
+        cr = self.env.cr
+        sources = [
+            ('btp.lead', 'btp_lead', '',
+             ['site_name', 'site_address', 'site_zip', 'partner_name', 'partner_phone', 'partner_email'],
+             lead_dedup_keys),
+            ('res.partner', 'res_partner', 'is_company IS NOT TRUE AND',
+             ['name', 'email', 'phone', 'mobile'],
+             contact_dedup_keys),
+        ]
+        for model_name, table, where, columns, key_builder in sources:
+            if not tools.table_exists(cr, table):
+                continue
+            selected = SQL(", ").join(
+                SQL.identifier(column) if tools.column_exists(cr, table, column) else SQL("NULL")
+                for column in columns
+            )
+            last_id = 0
+            while True:
+                cr.execute(SQL(
+                    "SELECT id, %s FROM %s WHERE %s id > %s ORDER BY id LIMIT %s",
+                    selected, SQL.identifier(table), SQL(where), last_id, BACKFILL_BATCH_SIZE,
+                ))
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                self._insert_keys(model_name, {row[0]: key_builder(*row[1:]) for row in rows})
+                last_id = rows[-1][0]
+            _logger.info('Built duplicate blocking keys for %s', model_name)
+
+    @api.model
+    def _insert_keys(self, model_name, keys_by_id):
+        rows = [
+            (res_id, key_type, key_value)
+            for res_id, keys in keys_by_id.items()
+            for key_type, key_value in keys
+        ]
+        if not rows:
+            return
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO btp_dedup_key (res_model, res_id, key_type, key_value)
+            SELECT %s, * FROM unnest(%s::int[], %s::varchar[], %s::varchar[])
+            """,
+            model_name,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+        ))
+
+    @api.model
+    def _remove_records(self, records):
+        """Drop the keys of ``records``"""
+        if records.ids:
+            self.env.cr.execute(SQL(
+                "DELETE FROM btp_dedup_key WHERE res_model = %s AND res_id = ANY(%s)",
+                records._name, records.ids,
+            ))
+
+    @api.model
+    def _sync_records(self, records, replace=True):
+        """Replace the keys of ``records`` by their current blocking keys
+
+        :param replace: False when ``records`` were just created and own no key yet
+        """
+        if replace:
+            self._remove_records(records)
+        self._insert_keys(records._name, records._get_dedup_keys())
+
+    @api.model
+    def _find_first_match(self, model_name, keys, exclude_ids=()):
+        """Return (res id, key type) of a record owning one of ``keys``, or None
+
+        One indexed branch per key type, combined with UNION ALL; key types
+        are tried in the order of their first appearance in ``keys``.
+        """
+        values_by_type = {}
+        for key_type, key_value in keys:
+            values_by_type.setdefault(key_type, []).append(key_value)
+        if not values_by_type:
+            return None
+        branches = [
+            SQL(
+                """
+                (SELECT res_id, %(key_type)s, %(priority)s AS priority
+                   FROM btp_dedup_key
+                  WHERE res_model = %(model)s
+                    AND key_type = %(key_type)s
+                    AND key_value = ANY(%(values)s)
+                    AND res_id != ALL(%(exclude_ids)s::int[])
+               ORDER BY res_id
+                  LIMIT 1)
+                """,
+                key_type=key_type,
+                priority=priority,
+                model=model_name,
+                values=values,
+                exclude_ids=list(exclude_ids),
+            )
+            for priority, (key_type, values) in enumerate(values_by_type.items())
+        ]
+        self.env.cr.execute(SQL(
+            "%s ORDER BY priority LIMIT 1",
+            SQL(" UNION ALL ").join(branches),
+        ))
+        row = self.env.cr.fetchone()
+        return (row[0], row[1]) if row else None
+
+    @api.model
+    def _find_matching_pairs(self, model_name, res_ids):
+        """Return {res id: [ids of other records sharing a key]} for ``res_ids``"""
+        result = {}
+        if not res_ids:
+            return result
+        self.env.cr.execute(SQL(
+            """
+            SELECT DISTINCT k.res_id, o.res_id
+              FROM btp_dedup_key k
+              JOIN btp_dedup_key o
+                ON o.key_type = k.key_type
+               AND o.key_value = k.key_value
+               AND o.res_model = k.res_model
+             WHERE k.res_model = %s
+               AND k.res_id = ANY(%s)
+               AND o.res_id != k.res_id
+            """,
+            model_name, list(res_ids),
+        ))
+        for res_id, match_id in self.env.cr.fetchall():
+            result.setdefault(res_id, []).append(match_id)
+        return result
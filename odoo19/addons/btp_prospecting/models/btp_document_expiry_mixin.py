@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class BtpDocumentExpiryMixin(models.AbstractModel):
+    """Daily refresh of the stored expiry flags of dated documents
+
+    Inheriting models define a stored ``expiration_date`` and the stored
+    ``is_expired`` / ``expires_soon`` flags computed from it.
+    """
+    _name = 'btp.document.expiry.mixin'
+    _description = 'BTP Document Expiry Mixin'
+
+    @api.model
+    def _refresh_expiry_flags(self):
+        """Recompute the date-dependent flags of the documents whose status changed
+
+        ``is_expired`` and ``expires_soon`` only depend on ``expiration_date``
+        in the ORM, so they go stale as days pass. Documents crossing a
+        threshold since their last computation are found with one indexed
+        query, and only they and their parent's counters are recomputed.
+        """
+        today = fields.Date.today()
+        self.flush_model(['expiration_date', 'is_expired', 'expires_soon'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT id
+              FROM %(table)s
+             WHERE (expiration_date < %(today)s AND (is_expired IS NOT TRUE OR expires_soon))
+                OR (expiration_date >= %(today)s AND expiration_date <= %(warning_date)s
+                    AND (expires_soon IS NOT TRUE OR is_expired))
+            """,
+            table=SQL.identifier(self._table),
+            today=today,
+            warning_date=today + timedelta(days=30),
+        ))
+        documents = self.with_context(active_test=False).browse([row[0] for row in self.env.cr.fetchall()])
+        if not documents:
+            return documents
+        for field_name in ('is_expired', 'expires_soon'):
+            self.env.add_to_compute(self._fields[field_name], documents)
+        # Mark the document counters of the parents as well
+        documents.modified(['is_expired', 'expires_soon'])
+        self.env.flush_all()
+        _logger.info('Refreshed expiry flags of %d %s records', len(documents), self._name)
+        return documents
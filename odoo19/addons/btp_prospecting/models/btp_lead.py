@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
 from markupsafe import Markup
+from collections import defaultdict
 from datetime import datetime, timedelta
 import logging
 
+from .btp_dedup_key import LEAD_DEDUP_FIELDS, lead_dedup_keys
+from .btp_lead_duplicate import MATCH_COLUMNS, ensure_trigram, normalize_text
+
 _logger = logging.getLogger(__name__)
 
+REMINDER_BATCH_SIZE = 200
+LOOP_REMINDER_DELAY_DAYS = 180
+LOOP_REMINDER_RESPONSE_STATUSES = ('lost', 'not_interested', 'no_need_now')
+
 
 class BtpLead(models.Model):
     """BTP Lead Model - Core lead management for Building and Public Works industry"""
@@ -75,6 +84,7 @@ class BtpLead(models.Model):
         'res.partner',
         string='Client/Prospect',
         tracking=True,
+        index=True,
         help='Client or prospect company'
     )
     contact_id = fields.Many2one(
@@ -241,6 +251,14 @@ class BtpLead(models.Model):
         string='Escalation Reason',
         help='Reason for escalation'
     )
+    next_loop_date = fields.Datetime(
+        string='Next Loop Reminder',
+        compute='_compute_next_loop_date',
+        store=True,
+        readonly=False,
+        index=True,
+        help='Date of the next 6-month loop reminder of a lost/unsuccessful lead'
+    )
     
     # ========== Response Classification ==========
     response_status = fields.Selection([
@@ -298,6 +316,27 @@ class BtpLead(models.Model):
         string='Original Lead',
         help='Original lead if this is a duplicate'
     )
+    # Normalized copies used by the duplicate engine (trigram indexed, see init)
+    name_normalized = fields.Char(
+        compute='_compute_normalized_fields',
+        store=True,
+        help='Lowercased, unaccented lead title used for duplicate matching'
+    )
+    site_name_normalized = fields.Char(
+        compute='_compute_normalized_fields',
+        store=True,
+        help='Lowercased, unaccented site name used for duplicate matching'
+    )
+    site_address_normalized = fields.Char(
+        compute='_compute_normalized_fields',
+        store=True,
+        help='Lowercased, unaccented site address used for duplicate matching'
+    )
+    partner_name_normalized = fields.Char(
+        compute='_compute_normalized_fields',
+        store=True,
+        help='Lowercased, unaccented client name used for duplicate matching'
+    )
     
     # ========== Conversion ==========
     converted = fields.Boolean(
@@ -379,20 +418,65 @@ class BtpLead(models.Model):
     def _compute_expected_revenue(self):
         for lead in self:
             lead.expected_revenue = (lead.budget or 0.0) * (lead.probability / 100.0)
+
+    @api.depends('stage_id.is_lost', 'response_status', 'converted_date')
+    def _compute_next_loop_date(self):
+        for lead in self:
+            if (lead.stage_id.is_lost and lead.converted_date
+                    and lead.response_status in LOOP_REMINDER_RESPONSE_STATUSES):
+                # Scheduled when the lead enters the loop; moving between loop
+                # statuses keeps the schedule advanced by the loop cron
+                if not lead.next_loop_date:
+                    lead.next_loop_date = lead.converted_date + timedelta(days=LOOP_REMINDER_DELAY_DAYS)
+            else:
+                lead.next_loop_date = False
+
+    @api.depends('name', 'site_name', 'site_address', 'partner_name')
+    def _compute_normalized_fields(self):
+        for lead in self:
+            lead.name_normalized = normalize_text(lead.name)
+            lead.site_name_normalized = normalize_text(lead.site_name)
+            lead.site_address_normalized = normalize_text(lead.site_address)
+            lead.partner_name_normalized = normalize_text(lead.partner_name)
     
     @api.depends('message_ids')
     def _compute_communication_stats(self):
-        for lead in self:
-            messages = lead.message_ids.filtered(lambda m: m.message_type in ['email', 'notification'])
-            lead.email_count = len(messages.filtered(lambda m: m.message_type == 'email'))
+        """Count emails and call/meeting activities of all leads with grouped queries"""
+        lead_ids = self._origin.ids
+        email_counts = {}
+        activity_counts = {}
+        if lead_ids:
+            email_counts = dict(self.env['mail.message'].sudo()._read_group(
+                [('model', '=', 'btp.lead'), ('res_id', 'in', lead_ids), ('message_type', '=', 'email')],
+                ['res_id'], ['__count'],
+            ))
             # Calls and meetings would come from activities
-            activities = self.env['mail.activity'].search([
-                ('res_id', '=', lead.id),
-                ('res_model', '=', 'btp.lead')
-            ])
-            lead.call_count = len(activities.filtered(lambda a: a.activity_type_id.category == 'call'))
-            lead.meeting_count = len(activities.filtered(lambda a: a.activity_type_id.category == 'meeting'))
+            for res_id, activity_type, count in self.env['mail.activity'].sudo()._read_group(
+                [('res_model', '=', 'btp.lead'), ('res_id', 'in', lead_ids),
+                 ('activity_type_id.category', 'in', ['call', 'meeting'])],
+                ['res_id', 'activity_type_id'], ['__count'],
+            ):
+                key = (res_id, activity_type.category)
+                activity_counts[key] = activity_counts.get(key, 0) + count
+        for lead in self:
+            lead_id = lead._origin.id
+            lead.email_count = email_counts.get(lead_id, 0)
+            lead.call_count = activity_counts.get((lead_id, 'call'), 0)
+            lead.meeting_count = activity_counts.get((lead_id, 'meeting'), 0)
     
+    def init(self):
+        """Create the pg_trgm GIN indexes used by the duplicate engine"""
+        cr = self.env.cr
+        if not ensure_trigram(self.env):
+            _logger.warning('pg_trgm extension is not available: lead duplicate detection '
+                            'will fall back to ilike scans.')
+            return
+        for column in MATCH_COLUMNS:
+            tools.create_index(
+                cr, f'{self._table}_{column}_trgm_index', self._table,
+                [f'{column} gin_trgm_ops'], method='gin',
+            )
+
     # ========== Defaults ==========
     @api.model
     def _get_default_stage(self):
@@ -583,7 +667,7 @@ class BtpLead(models.Model):
                 raise UserError(_('You can only send reminders for leads assigned to you.'))
         
         # Send the reminder
-        self._send_reminder()
+        self._send_reminders(force_send=True)
         
         return {
             'type': 'ir.actions.client',
@@ -605,21 +689,9 @@ class BtpLead(models.Model):
         # Use sudo() to find all duplicates regardless of access rights
         all_duplicates = self._find_duplicates()
         
-        # Filter to only show duplicates the current user can access
-        # Check access by trying to search for each duplicate with user's access rights
-        visible_duplicates = self.env['btp.lead']
-        accessible_ids = []
-        
-        for dup in all_duplicates:
-            try:
-                # Check if user can access this duplicate by searching for it
-                accessible = self.env['btp.lead'].search([('id', '=', dup.id)], limit=1)
-                if accessible:
-                    visible_duplicates |= dup
-                    accessible_ids.append(dup.id)
-            except:
-                # User doesn't have access to this duplicate
-                pass
+        # Filter to only show duplicates the current user can access (single search)
+        visible_duplicates = self.env['btp.lead'].search([('id', 'in', all_duplicates.ids)])
+        accessible_ids = visible_duplicates.ids
         
         # Only store duplicates the user can access (to avoid access rights errors)
         if accessible_ids:
@@ -670,84 +742,28 @@ class BtpLead(models.Model):
     
     def _find_duplicates(self):
         """Find potential duplicate leads
-        
+
         Duplicate detection criteria (OR logic - matches if ANY criteria match):
-        1. Same site_name (case-insensitive)
+        1. Similar site_name
         2. Same partner_id (if both have partner)
-        3. Same partner_name (if both have partner_name, case-insensitive)
-        4. Similar site_address (first 50 chars, case-insensitive)
-        5. Same lead name (case-insensitive) - if very similar names
-        
-        Uses sudo() to bypass record rules and find all potential duplicates,
-        regardless of who can see them. This ensures comprehensive duplicate detection.
+        3. Similar partner_name (if the lead has no partner)
+        4. Similar site_address (first meaningful part)
+        5. Similar lead name - if meaningful
+
+        Matching is delegated to ``btp.lead.duplicate.engine``, which ranks
+        candidates by trigram similarity on normalized columns and caps the
+        result set. Record rules are bypassed so that detection is
+        comprehensive, regardless of who can see the duplicates.
         """
         self.ensure_one()
-        
-        # Base domain: exclude current lead
-        base_domain = [
-            ('id', '!=', self.id),
-        ]
-        
-        # Build OR conditions for duplicate detection
-        or_conditions = []
-        
-        # 1. Check by site_name (most common identifier for BTP leads)
-        if self.site_name:
-            or_conditions.append(('site_name', 'ilike', self.site_name))
-        
-        # 2. Check by partner_id (if both leads have a partner)
-        if self.partner_id:
-            or_conditions.append(('partner_id', '=', self.partner_id.id))
-        
-        # 3. Check by partner_name (if both leads have partner_name but no partner_id)
-        if self.partner_name and not self.partner_id:
-            or_conditions.append(('partner_name', 'ilike', self.partner_name))
-        
-        # 4. Check by site_address (similar address - use first meaningful part)
-        if self.site_address:
-            address_clean = self.site_address.strip()
-            # Extract first meaningful part (before comma or first 30 chars)
-            if ',' in address_clean:
-                address_search = address_clean.split(',')[0].strip()
-            else:
-                address_search = address_clean[:30].strip()
-            
-            if len(address_search) >= 5:  # Only if address is meaningful (reduced from 10)
-                or_conditions.append(('site_address', 'ilike', '%' + address_search + '%'))
-        
-        # 5. Check by lead name (if names are very similar)
-        if self.name:
-            # Remove common suffixes/prefixes and check similarity
-            name_clean = self.name.strip()
-            if len(name_clean) >= 5:  # Only if name is meaningful
-                or_conditions.append(('name', 'ilike', name_clean))
-        
-        # If no criteria to check, return empty
-        if not or_conditions:
-            return self.env['btp.lead']
-        
-        # Build final domain with OR logic
-        # Odoo OR syntax: ['|', '|', condition1, condition2, condition3] means (condition1 OR condition2) OR condition3
-        domain = base_domain.copy()
-        
-        if len(or_conditions) == 1:
-            # Single condition: just add it
-            domain.extend(or_conditions)
-        else:
-            # Multiple conditions: need OR operators
-            # For n conditions, we need n-1 OR operators at the beginning
-            # Format: ['|', '|', ..., condition1, condition2, ..., conditionN]
-            or_operators = ['|'] * (len(or_conditions) - 1)
-            domain.extend(or_operators)
-            domain.extend(or_conditions)
-        
-        # Use sudo() to bypass record rules and find all duplicates
-        duplicates = self.sudo().search(domain)
-        return duplicates
+        return self.env['btp.lead.duplicate.engine'].find_duplicates(self)
     
     # ========== Override Create ==========
     @api.model_create_multi
     def create(self, vals_list):
+        # Prefetch the categories of all partners used by assignment rules at once
+        partner_ids = {vals['partner_id'] for vals in vals_list if vals.get('partner_id')}
+        self.env['res.partner'].sudo().browse(partner_ids).category_id
         for vals in vals_list:
             # Enforce non-sales leads as common open (bypass auto-assignment)
             if self.env.user.has_group('btp_prospecting.group_btp_non_sales'):
@@ -779,46 +795,73 @@ class BtpLead(models.Model):
                 vals['next_reminder_date'] = fields.Datetime.now()
         
         leads = super(BtpLead, self).create(vals_list)
-        for lead in leads:
-            # Automatically detect duplicates on creation
-            # Use sudo() to find all duplicates regardless of access rights
-            duplicates = lead.sudo()._find_duplicates()
-            if duplicates:
-                # Filter to only store duplicates the current user can access
-                accessible_ids = []
-                all_duplicate_count = len(duplicates)
-                
-                for dup in duplicates:
-                    try:
-                        # Check if user can access this duplicate
-                        accessible = self.env['btp.lead'].search([('id', '=', dup.id)], limit=1)
-                        if accessible:
-                            accessible_ids.append(dup.id)
-                    except:
-                        pass
-                
-                # Store accessible duplicates using sudo() to avoid access issues
-                if accessible_ids:
-                    lead.sudo().write({'duplicate_ids': [(6, 0, accessible_ids)]})
-                
-                # Add a note to the lead if duplicates were found
-                if all_duplicate_count > 0:
-                    accessible_count = len(accessible_ids)
-                    if accessible_count > 0:
-                        message = _('⚠️ <strong>Potential Duplicates Detected:</strong> %d duplicate lead(s) found during creation. Please review the "Duplicates" tab.') % accessible_count
-                        if all_duplicate_count > accessible_count:
-                            message += _('<br/>Note: %d additional duplicate(s) were found but you don\'t have access to view them.') % (all_duplicate_count - accessible_count)
-                    else:
-                        message = _('⚠️ <strong>Potential Duplicates Detected:</strong> %d duplicate lead(s) found during creation, but you don\'t have access to view them. Contact your manager for assistance.') % all_duplicate_count
-                    
-                    # Format message as HTML
-                    lead.sudo().message_post(
-                        body=Markup(message),
-                        subject=_('Duplicate Detection'),
-                    )
-
+        self.env['btp.dedup.key'].sudo()._sync_records(leads, replace=False)
+        # Automatically detect duplicates on creation, for the whole batch at once,
+        # or leave it to the queue cron when detection is deferred
+        DuplicateQueue = self.env['btp.lead.duplicate.queue']
+        if DuplicateQueue._is_deferred():
+            DuplicateQueue._enqueue(leads)
+        else:
+            leads._detect_duplicates()
         return leads
 
+    def _detect_duplicates(self):
+        """Detect, link and report potential duplicates for a batch of leads
+
+        Candidates for all leads are found in a single ranked query (sudo),
+        their visibility for the current user is checked with one search and
+        the accessible ones are linked in bulk. A chatter note is logged on
+        every lead that has potential duplicates.
+        """
+        if not self:
+            return
+        candidates = self.env['btp.lead.duplicate.engine'].find_duplicates_batch(self)
+        all_candidate_ids = {dup_id for dup_ids in candidates.values() for dup_id in dup_ids}
+        if not all_candidate_ids:
+            return
+
+        # Filter to only store duplicates the current user can access
+        accessible_ids = set(self.env['btp.lead'].search([('id', 'in', list(all_candidate_ids))]).ids)
+        links = [
+            (lead_id, dup_id)
+            for lead_id, dup_ids in candidates.items()
+            for dup_id in dup_ids
+            if dup_id in accessible_ids
+        ]
+        if links:
+            self._link_duplicates(links)
+
+        bodies = {}
+        for lead in self:
+            all_duplicate_count = len(candidates.get(lead.id, []))
+            if not all_duplicate_count:
+                continue
+            accessible_count = len([dup_id for dup_id in candidates[lead.id] if dup_id in accessible_ids])
+            if accessible_count > 0:
+                message = _('⚠️ <strong>Potential Duplicates Detected:</strong> %d duplicate lead(s) found during creation. Please review the "Duplicates" tab.') % accessible_count
+                if all_duplicate_count > accessible_count:
+                    message += _('<br/>Note: %d additional duplicate(s) were found but you don\'t have access to view them.') % (all_duplicate_count - accessible_count)
+            else:
+                message = _('⚠️ <strong>Potential Duplicates Detected:</strong> %d duplicate lead(s) found during creation, but you don\'t have access to view them. Contact your manager for assistance.') % all_duplicate_count
+            bodies[lead.id] = Markup(message)
+
+        if bodies:
+            self.sudo()._message_log_batch(bodies=bodies)
+
+    def _link_duplicates(self, links):
+        """Insert (lead id, duplicate id) pairs into the duplicate relation in bulk"""
+        self.env['btp.lead'].flush_model(['duplicate_ids'])
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO btp_lead_duplicate_rel (lead_id, duplicate_id)
+            SELECT * FROM unnest(%s::int[], %s::int[])
+            ON CONFLICT DO NOTHING
+            """,
+            [lead_id for lead_id, _dup_id in links],
+            [dup_id for _lead_id, dup_id in links],
+        ))
+        self.env['btp.lead'].browse(list({lead_id for lead_id, _dup_id in links})).invalidate_recordset(['duplicate_ids'])
+
     def write(self, vals):
         if self.env.context.get('btp_skip_open_sync'):
             return super().write(vals)
@@ -854,34 +897,79 @@ class BtpLead(models.Model):
                 per_vals['last_assigned_user_id'] = per_vals['user_id']
                 per_vals['claimed_date'] = fields.Datetime.now()
                 result = super(BtpLead, lead).with_context(btp_skip_open_sync=True).write(per_vals)
-            return result
+        else:
+            # Leads moved off the user their rule assigned give back their monthly slot
+            reassigned = self.browse()
+            if 'user_id' in vals:
+                reassigned = self.filtered(lambda lead: lead.assignment_rule_id and lead.user_id.id != vals['user_id'])
+                reassigned._release_assignment_slots()
+            result = super().write(vals)
+            if reassigned:
+                super(BtpLead, reassigned).with_context(btp_skip_open_sync=True).write({'assignment_rule_id': False})
 
-        return super().write(vals)
+        if LEAD_DEDUP_FIELDS.intersection(vals):
+            self.env['btp.dedup.key'].sudo()._sync_records(self)
+        return result
+
+    def unlink(self):
+        self.env['btp.dedup.key'].sudo()._remove_records(self)
+        self._release_assignment_slots()
+        return super().unlink()
+
+    def _release_assignment_slots(self):
+        """Uncount the leads assigned this month by rules with a monthly limit"""
+        month = self.env['btp.lead.assignment.counter']._get_current_month()
+        counts = defaultdict(int)
+        for lead in self.sudo():
+            rule = lead.assignment_rule_id
+            if rule.max_leads_per_month and lead.create_date and lead.create_date.date() >= month:
+                counts[rule.id] += 1
+        self.env['btp.lead.assignment.counter'].sudo()._decrement(counts)
+
+    def _get_dedup_keys(self):
+        """Return {lead id: set of (key_type, key_value)} blocking keys"""
+        return {
+            lead.id: lead_dedup_keys(
+                lead.site_name, lead.site_address, lead.site_zip,
+                lead.partner_name, lead.partner_phone, lead.partner_email,
+            )
+            for lead in self
+        }
     
     def _auto_assign_lead(self, vals):
         """Auto-assign lead based on assignment rules
         
         Uses sudo() to bypass access rights since salespeople don't need
         direct access to assignment rules - this is an internal system operation.
+        The active rules are compiled once per company (see
+        ``btp.lead.assignment.rule._get_assignment_matcher``).
         """
+        category_ids = frozenset()
+        if vals.get('partner_id'):
+            category_ids = frozenset(self.env['res.partner'].sudo().browse(vals['partner_id']).category_id.ids)
+
         # Use sudo() to access assignment rules (salespeople can't read them directly)
-        rules = self.env['btp.lead.assignment.rule'].sudo().search([
-            ('active', '=', True),
-            ('company_id', 'in', [False, self.env.company.id]),
-        ], order='sequence')
-        
-        for rule in rules:
-            if rule.match(vals):
-                if rule.assignment_type == 'round_robin':
-                    assigned_user = rule.assign_round_robin()
-                else:
-                    assigned_user = rule.user_id
+        Rule = self.env['btp.lead.assignment.rule'].sudo()
+        for rule in Rule._get_matching_rules(vals, category_ids):
+            if rule.assignment_type == 'round_robin':
+                pool = rule._get_round_robin_pool()
+                if not pool:
+                    continue
+            elif not rule.user_id:
+                continue
 
-                if assigned_user:
-                    return {
-                        'user_id': assigned_user,
-                        'rule_id': rule,
-                    }
+            # Reserve the monthly slot before advancing the rotation, so that
+            # a full rule does not skip a salesperson
+            if not rule._reserve_monthly_slot():
+                continue
+            if rule.assignment_type == 'round_robin':
+                assigned_user = rule.assign_round_robin(pool)
+            else:
+                assigned_user = rule.user_id
+            return {
+                'user_id': assigned_user,
+                'rule_id': rule,
+            }
         
         return False
     
@@ -901,143 +989,257 @@ class BtpLead(models.Model):
     # ========== Cron Methods ==========
     @api.model
     def _cron_send_reminders(self):
-        """Send reminders for leads that need follow-up (D0, +15, +30)"""
+        """Send reminders for leads that need follow-up (D0, +15, +30)
+
+        Leads are processed in chunks committed one by one, so a run that hits
+        the cron time limit keeps the reminders already sent and the next run
+        resumes with the leads that are still due.
+        """
         now = fields.Datetime.now()
         
-        # Find leads that need reminders
-        leads = self.search([
+        # Find leads that need reminders (unassigned leads get none)
+        domain = [
             ('active', '=', True),
             ('converted', '=', False),
             ('next_reminder_date', '<=', now),
             ('next_reminder_date', '!=', False),
-        ])
-        
-        for lead in leads:
+            ('user_id', '!=', False),
+        ]
+        remaining = self.search_count(domain)
+        failed_ids = []
+        while remaining:
+            leads = self.search(domain + [('id', 'not in', failed_ids)], order='next_reminder_date, id', limit=REMINDER_BATCH_SIZE)
+            if not leads:
+                break
             try:
-                lead._send_reminder()
-            except Exception as e:
-                _logger.error(f"Error sending reminder for lead {lead.id}: {e}")
+                with self.env.cr.savepoint():
+                    leads._send_reminders()
+            except Exception:
+                # Isolate the faulty leads, the others of the chunk are still reminded
+                for lead in leads:
+                    try:
+                        with self.env.cr.savepoint():
+                            lead._send_reminders()
+                    except Exception as e:
+                        _logger.error(f"Error sending reminder for lead {lead.id}: {e}")
+                        failed_ids.append(lead.id)
+            remaining = max(remaining - len(leads), 0)
+            if not self.env['ir.cron']._commit_progress(len(leads), remaining=remaining):
+                break
         
         return True
     
     def _send_reminder(self):
         """Send reminder for this lead"""
         self.ensure_one()
-        
-        if not self.user_id:
+        self._send_reminders()
+
+    def _send_reminders(self, force_send=False):
+        """Send reminders for a batch of leads
+
+        Activities are created in one batch, emails go to the notification
+        digest (unless ``force_send``) and the reminder tracking is written
+        once per resulting reminder count.
+        """
+        leads = self.filtered('user_id')
+        if not leads:
             return
+        now = fields.Datetime.now()
+        today = fields.Date.today()
         
-        # Calculate days since last reminder or creation
-        if self.last_reminder_date:
-            days_since = (fields.Datetime.now() - self.last_reminder_date).days
-        else:
-            days_since = (fields.Datetime.now() - self.create_date).days
-        
-        # Determine reminder type
-        if days_since == 0:
-            reminder_type = 'D0'
-        elif days_since == 15:
-            reminder_type = '+15'
-        elif days_since >= 30:
-            reminder_type = '+30'
+        activity_vals_list = []
+        leads_by_count = {}
+        todo_type = self.env.ref('mail.mail_activity_data_todo')
+        for lead in leads:
+            # Calculate days since last reminder or creation
+            days_since = (now - (lead.last_reminder_date or lead.create_date)).days
+            
+            # Determine reminder type
+            if days_since == 0:
+                reminder_type = 'D0'
+            elif days_since == 15:
+                reminder_type = '+15'
+            elif days_since >= 30:
+                reminder_type = '+30'
+            else:
+                reminder_type = 'custom'
+            
+            activity_vals_list.append({
+                'res_model': 'btp.lead',
+                'res_id': lead.id,
+                'activity_type_id': todo_type.id,
+                'automated': True,
+                'date_deadline': today,
+                'summary': _('Lead Reminder: %s') % reminder_type,
+                'note': _('This lead requires follow-up. Next reminder was scheduled for %s.') % lead.next_reminder_date,
+                'user_id': lead.user_id.id,
+                'btp_dedup_key': f'reminder:{lead.reminder_count + 1}',
+            })
+            leads_by_count.setdefault(lead.reminder_count + 1, []).append(lead.id)
+        self.env['btp.activity.scheduler'].schedule(activity_vals_list)
+        
+        # Send email notification, immediately or through the digest outbox
+        if force_send:
+            template = self.env.ref('btp_prospecting.email_template_lead_reminder', raise_if_not_found=False)
+            mail_leads = leads.filtered(lambda lead: lead.user_id.email)
+            if template and mail_leads:
+                template.send_mail_batch(mail_leads.ids, force_send=True)
         else:
-            reminder_type = 'custom'
-        
-        # Create activity/notification using activity_schedule method
-        self.activity_schedule(
-            act_type_xmlid='mail.mail_activity_data_todo',
-            date_deadline=fields.Date.today(),
-            summary=_('Lead Reminder: %s') % reminder_type,
-            note=_('This lead requires follow-up. Next reminder was scheduled for %s.') % self.next_reminder_date,
-            user_id=self.user_id.id,
-        )
-        
-        # Send email notification
-        template = self.env.ref('btp_prospecting.email_template_lead_reminder', raise_if_not_found=False)
-        if template and self.user_id.email:
-            template.send_mail(self.id, force_send=True)
-        
-        # Update reminder tracking
-        self.write({
-            'last_reminder_date': fields.Datetime.now(),
-            'reminder_count': self.reminder_count + 1,
-        })
-        
-        # Schedule next reminder based on current stage
-        self._schedule_next_reminder()
+            self.env['btp.notification.outbox']._enqueue('reminder', {
+                user: user_leads.ids for user, user_leads in leads.grouped('user_id').items()
+            })
+        
+        # Update reminder tracking and schedule next reminder based on the count
+        for reminder_count, lead_ids in leads_by_count.items():
+            self.browse(lead_ids).write({
+                'last_reminder_date': now,
+                'reminder_count': reminder_count,
+                'next_reminder_date': self._get_next_reminder_date(reminder_count),
+            })
     
     def _schedule_next_reminder(self):
         """Schedule next reminder based on stage and reminder count"""
         self.ensure_one()
-        
-        if self.reminder_count == 0:
+        self.write({'next_reminder_date': self._get_next_reminder_date(self.reminder_count)})
+
+    @api.model
+    def _get_next_reminder_date(self, reminder_count):
+        """Return the next reminder date after ``reminder_count`` reminders"""
+        if reminder_count == 0:
             # D0: Today
-            next_date = fields.Datetime.now()
-        elif self.reminder_count == 1:
+            return fields.Datetime.now()
+        elif reminder_count == 1:
             # +15: 15 days from now
-            next_date = fields.Datetime.now() + timedelta(days=15)
-        elif self.reminder_count >= 2:
-            # +30: 30 days from now
-            next_date = fields.Datetime.now() + timedelta(days=30)
-        else:
-            next_date = fields.Datetime.now() + timedelta(days=30)
-        
-        self.write({'next_reminder_date': next_date})
+            return fields.Datetime.now() + timedelta(days=15)
+        # +30: 30 days from now
+        return fields.Datetime.now() + timedelta(days=30)
     
     @api.model
     def _cron_escalate_leads(self):
-        """Escalate leads that haven't been updated in 30+ days"""
+        """Escalate leads that haven't been updated in 30+ days
+
+        Leads are escalated in chunks committed one by one; when a chunk
+        fails, its leads are retried one by one so that a faulty lead does
+        not hold back the escalation of the others.
+        """
         now = fields.Datetime.now()
         escalation_threshold = now - timedelta(days=30)
         
         # Find leads that need escalation
-        leads = self.search([
+        domain = [
             ('active', '=', True),
             ('converted', '=', False),
             ('is_escalated', '=', False),
             ('write_date', '<=', escalation_threshold),
-        ])
-        
-        for lead in leads:
+        ]
+        remaining = self.search_count(domain)
+        failed_ids = []
+        while remaining:
+            # Escalated leads leave the domain
+            leads = self.search(domain + [('id', 'not in', failed_ids)], order='id', limit=REMINDER_BATCH_SIZE)
+            if not leads:
+                break
             try:
-                lead._escalate_to_management()
-            except Exception as e:
-                _logger.error(f"Error escalating lead {lead.id}: {e}")
+                with self.env.cr.savepoint():
+                    leads._escalate_to_management()
+            except Exception:
+                for lead in leads:
+                    try:
+                        with self.env.cr.savepoint():
+                            lead._escalate_to_management()
+                    except Exception as e:
+                        _logger.error(f"Error escalating lead {lead.id}: {e}")
+                        failed_ids.append(lead.id)
+            remaining = max(remaining - len(leads), 0)
+            if not self.env['ir.cron']._commit_progress(len(leads), remaining=remaining):
+                break
         
         return True
     
+    def _get_escalation_managers(self):
+        """Return {lead id: manager} for the leads, resolving each user's manager once
+
+        Manager is the user's manager, else the user's sales team leader, else
+        any BTP manager (searched at most once).
+        """
+        managers_by_user = {}
+        for user in self.user_id:
+            if user.manager_id:
+                managers_by_user[user.id] = user.manager_id
+            elif user.sale_team_id and user.sale_team_id.user_id:
+                managers_by_user[user.id] = user.sale_team_id.user_id
+
+        fallback_manager = None
+        result = {}
+        for lead in self:
+            manager = managers_by_user.get(lead.user_id.id)
+            if not manager:
+                if fallback_manager is None:
+                    # Find any BTP manager
+                    fallback_manager = self.env['res.users'].search([
+                        ('groups_id', 'in', self.env.ref('btp_prospecting.group_btp_manager').ids)
+                    ], limit=1)
+                manager = fallback_manager
+            result[lead.id] = manager
+        return result
+
     def _escalate_to_management(self):
-        """Escalate lead to management"""
-        self.ensure_one()
-        
-        # Find manager (user's manager or team manager)
-        manager = False
-        if self.user_id and self.user_id.manager_id:
-            manager = self.user_id.manager_id
-        elif self.user_id and self.user_id.sale_team_id and self.user_id.sale_team_id.user_id:
-            manager = self.user_id.sale_team_id.user_id
-        
-        if not manager:
-            # Find any BTP manager
-            manager = self.env['res.users'].search([
-                ('groups_id', 'in', self.env.ref('btp_prospecting.group_btp_manager').ids)
-            ], limit=1)
-        
-        if manager:
-            # Create activity for manager using activity_schedule method
-            self.activity_schedule(
-                act_type_xmlid='mail.mail_activity_data_todo',
-                date_deadline=fields.Date.today(),
-                summary=_('Lead Escalation: Stalled Lead'),
-                note=_('This lead has been stalled for 30+ days and requires management attention. '
-                       'Consider reassigning or taking action.'),
-                user_id=manager.id,
-            )
-            
-            # Send email to manager
-            template = self.env.ref('btp_prospecting.email_template_lead_escalation', raise_if_not_found=False)
-            if template and manager.email:
-                template.send_mail(self.id, force_send=True)
+        """Escalate leads to management, with one digest per manager
+
+        Leads are grouped by manager; each manager gets a single activity
+        per day listing their stalled leads (later batches of the escalation
+        cron extend it), the leads being emailed through the notification
+        digest.
+        """
+        if not self:
+            return
+        leads_by_manager = {}
+        for lead_id, manager in self._get_escalation_managers().items():
+            if manager:
+                leads_by_manager.setdefault(manager, []).append(lead_id)
+
+        todo_type = self.env.ref('mail.mail_activity_data_todo')
+        today = fields.Date.today()
+        dedup_keys = {manager: f'escalation:{manager.id}:{fields.Date.to_string(today)}' for manager in leads_by_manager}
+        digests = {
+            activity.btp_dedup_key: activity
+            for activity in self.env['mail.activity'].sudo().search([
+                ('res_model', '=', 'btp.lead'),
+                ('btp_dedup_key', 'in', list(dedup_keys.values())),
+            ])
+        }
+        activity_vals_list = []
+        for manager, lead_ids in leads_by_manager.items():
+            leads = self.browse(lead_ids)
+            items = Markup('').join(Markup('<li>%s</li>') % lead.display_name for lead in leads)
+            digest = digests.get(dedup_keys[manager])
+            if digest:
+                # Leads of an earlier batch already have their digest: extend it
+                note = digest.note or Markup('')
+                digest.write({
+                    'summary': _('Lead Escalation: %d Stalled Lead(s)') % (note.count('<li>') + len(leads)),
+                    'note': note.replace(Markup('</ul>'), items + Markup('</ul>'), 1),
+                })
+                continue
+            # Digest activity for manager, on the first stalled lead
+            activity_vals_list.append({
+                'res_model': 'btp.lead',
+                'res_id': leads[0].id,
+                'activity_type_id': todo_type.id,
+                'automated': True,
+                'date_deadline': today,
+                'summary': _('Lead Escalation: %d Stalled Lead(s)') % len(leads),
+                'note': Markup('<p>%s</p><ul>%s</ul>') % (
+                    _('These leads have been stalled for 30+ days and require management attention. '
+                      'Consider reassigning or taking action.'),
+                    items,
+                ),
+                'user_id': manager.id,
+                'btp_dedup_key': dedup_keys[manager],
+            })
+        self.env['btp.activity.scheduler'].schedule(activity_vals_list)
+        # Email to managers through the notification digest
+        self.env['btp.notification.outbox']._enqueue('escalation', leads_by_manager)
         
         self.write({
             'is_escalated': True,
@@ -1047,47 +1249,81 @@ class BtpLead(models.Model):
     
     @api.model
     def _cron_send_loop_reminders(self):
-        """Send 6-month loop reminders for lost/end-of-site/unsuccessful leads"""
+        """Send 6-month loop reminders for lost/end-of-site/unsuccessful leads
+
+        Only leads whose ``next_loop_date`` is due are selected (indexed
+        range); each reminded lead gets its next loop date 6 months later,
+        which takes it out of the range.
+        """
         now = fields.Datetime.now()
-        six_months_ago = now - timedelta(days=180)
         
         # Find leads that need 6-month loop reminders
         # This includes: lost leads, end-of-site leads, unsuccessful leads
-        leads = self.search([
+        domain = [
             ('active', '=', True),
+            ('next_loop_date', '<=', now),
             ('stage_id.is_lost', '=', True),
-            ('converted_date', '<=', six_months_ago),
-            ('response_status', 'in', ['lost', 'not_interested', 'no_need_now']),
-        ])
-        
-        for lead in leads:
+            ('response_status', 'in', list(LOOP_REMINDER_RESPONSE_STATUSES)),
+        ]
+        remaining = self.search_count(domain)
+        failed_ids = []
+        while remaining:
+            # Reminded leads leave the range as their loop date moves forward;
+            # failed ones stay due and are retried by the next run
+            leads = self.search(domain + [('id', 'not in', failed_ids)], order='next_loop_date, id', limit=REMINDER_BATCH_SIZE)
+            if not leads:
+                break
             try:
-                lead._send_loop_reminder()
-            except Exception as e:
-                _logger.error(f"Error sending loop reminder for lead {lead.id}: {e}")
+                with self.env.cr.savepoint():
+                    leads._send_loop_reminders()
+                reminded = leads
+            except Exception:
+                # Isolate the faulty leads, the others of the chunk are still reminded
+                reminded = self.browse()
+                for lead in leads:
+                    try:
+                        with self.env.cr.savepoint():
+                            lead._send_loop_reminders()
+                        reminded |= lead
+                    except Exception as e:
+                        _logger.error(f"Error sending loop reminder for lead {lead.id}: {e}")
+                        failed_ids.append(lead.id)
+            reminded.write({'next_loop_date': now + timedelta(days=LOOP_REMINDER_DELAY_DAYS)})
+            remaining = max(remaining - len(leads), 0)
+            if not self.env['ir.cron']._commit_progress(len(leads), remaining=remaining):
+                break
         
         return True
     
     def _send_loop_reminder(self):
         """Send 6-month loop reminder"""
         self.ensure_one()
-        
-        if not self.user_id:
+        self._send_loop_reminders()
+
+    def _send_loop_reminders(self):
+        """Send 6-month loop reminders for a batch of leads"""
+        leads = self.filtered('user_id')
+        if not leads:
             return
         
-        # Create activity using activity_schedule method
-        self.activity_schedule(
-            act_type_xmlid='mail.mail_activity_data_todo',
-            date_deadline=fields.Date.today(),
-            summary=_('6-Month Loop Reminder'),
-            note=_('This lead was lost/unsuccessful 6 months ago. Consider re-contacting for new opportunities.'),
-            user_id=self.user_id.id,
-        )
-        
-        # Send email
-        template = self.env.ref('btp_prospecting.email_template_lead_loop_reminder', raise_if_not_found=False)
-        if template and self.user_id.email:
-            template.send_mail(self.id, force_send=True)
+        # Create activities in one batch, once per loop date
+        todo_type = self.env.ref('mail.mail_activity_data_todo')
+        self.env['btp.activity.scheduler'].schedule([{
+            'res_model': 'btp.lead',
+            'res_id': lead.id,
+            'activity_type_id': todo_type.id,
+            'automated': True,
+            'date_deadline': fields.Date.today(),
+            'summary': _('6-Month Loop Reminder'),
+            'note': _('This lead was lost/unsuccessful 6 months ago. Consider re-contacting for new opportunities.'),
+            'user_id': lead.user_id.id,
+            'btp_dedup_key': f'loop_reminder:{fields.Date.to_string(lead.next_loop_date or fields.Date.today())}',
+        } for lead in leads])
+        
+        # Email through the notification digest
+        self.env['btp.notification.outbox']._enqueue('loop_reminder', {
+            user: user_leads.ids for user, user_leads in leads.grouped('user_id').items()
+        })
 
 
 class BtpLeadTag(models.Model):
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools import SQL, str2bool
+import logging
+import psycopg2
+import unicodedata
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RESULTS = 20
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+QUEUE_BATCH_SIZE = 200
+MATCH_COLUMNS = (
+    'site_name_normalized',
+    'partner_name_normalized',
+    'site_address_normalized',
+    'name_normalized',
+)
+
+
+def normalize_text(value):
+    """Lowercase, strip accents and collapse whitespace for fuzzy matching"""
+    if not value:
+        return False
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split()) or False
+
+
+def ensure_trigram(env):
+    """Install pg_trgm if needed; return whether trigram indexes can be used"""
+    if not env.registry.has_trigram:
+        try:
+            with env.cr.savepoint(flush=False):
+                env.cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            env.registry.has_trigram = True
+        except psycopg2.Error:
+            return False
+    return True
+
+
+def address_head(value):
+    """Return the first meaningful part of an address (before comma or first 30 chars)"""
+    if not value:
+        return False
+    address_clean = value.strip()
+    if ',' in address_clean:
+        address_search = address_clean.split(',')[0].strip()
+    else:
+        address_search = address_clean[:30].strip()
+    # Only if address is meaningful
+    return address_search if len(address_search) >= 5 else False
+
+
+class BtpLeadDuplicateEngine(models.AbstractModel):
+    """Duplicate matching engine for BTP leads
+
+    Candidates are matched with pg_trgm word similarity against the
+    normalized copies of the lead columns (see ``btp.lead.init``), ranked by
+    their best score and capped, so that detection cost does not grow with
+    the size of the lead table.
+    """
+    _name = 'btp.lead.duplicate.engine'
+    _description = 'BTP Lead Duplicate Matching Engine'
+
+    @api.model
+    def _get_max_results(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'btp_prospecting.duplicate_max_results', DEFAULT_MAX_RESULTS
+        ))
+
+    @api.model
+    def _get_similarity_threshold(self):
+        return float(self.env['ir.config_parameter'].sudo().get_param(
+            'btp_prospecting.duplicate_similarity_threshold', DEFAULT_SIMILARITY_THRESHOLD
+        ))
+
+    @api.model
+    def _get_match_terms(self, lead):
+        """Return {normalized column: needle} for the criteria of ``lead``
+
+        Criteria (OR logic - matches if ANY criteria match):
+        1. Site name
+        2. Client name (only when the lead has no partner)
+        3. Site address (first meaningful part)
+        4. Lead title (if meaningful)
+        Same partner_id is handled separately as an exact match.
+        """
+        terms = {}
+        if lead.site_name:
+            terms['site_name_normalized'] = normalize_text(lead.site_name)
+
+        if lead.partner_name and not lead.partner_id:
+            terms['partner_name_normalized'] = normalize_text(lead.partner_name)
+
+        if lead.site_address:
+            terms['site_address_normalized'] = normalize_text(address_head(lead.site_address))
+
+        if lead.name:
+            name_clean = lead.name.strip()
+            if len(name_clean) >= 5:
+                terms['name_normalized'] = normalize_text(name_clean)
+
+        return {column: needle for column, needle in terms.items() if needle}
+
+    @api.model
+    def find_duplicates(self, lead, limit=None):
+        """Return the best ranked potential duplicates of ``lead`` (sudo recordset)"""
+        lead.ensure_one()
+        duplicate_ids = self.find_duplicates_batch(lead, limit=limit)[lead.id]
+        return self.env['btp.lead'].sudo().browse(duplicate_ids)
+
+    @api.model
+    def find_duplicates_batch(self, leads, limit=None):
+        """Return {lead id: [duplicate ids, best first]} for a batch of leads
+
+        All leads are matched in a single statement: each lead of the batch
+        is joined laterally to its own ranked, capped candidate list. Leads
+        sharing a blocking key (see ``btp.dedup.key``) are exact matches and
+        rank first; the others are ranked by trigram word similarity.
+        """
+        Lead = self.env['btp.lead'].sudo()
+        limit = limit or self._get_max_results()
+        result = {lead.id: [] for lead in leads}
+        if not leads:
+            return result
+        needles = [(lead, self._get_match_terms(lead)) for lead in leads]
+
+        if not self.env.registry.has_trigram:
+            key_matches = self.env['btp.dedup.key'].sudo()._find_matching_pairs('btp.lead', leads.ids)
+            for lead, terms in needles:
+                domain = self._get_fallback_domain(lead, terms, key_matches.get(lead.id, []))
+                if domain:
+                    result[lead.id] = Lead.search(domain, limit=limit).ids
+            return result
+
+        Lead.flush_model(['active', 'partner_id'] + list(MATCH_COLUMNS))
+        self.env.cr.execute(SQL(
+            "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+            str(self._get_similarity_threshold()),
+        ))
+        conditions = [SQL("l.id = ANY(b.ids)"), SQL("l.partner_id = n.partner_id")]
+        scores = [
+            SQL("CASE WHEN l.id = ANY(b.ids) OR l.partner_id = n.partner_id THEN 1.0 ELSE 0.0 END"),
+        ]
+        for column in MATCH_COLUMNS:
+            conditions.append(SQL("n.%s <%% l.%s", SQL.identifier(column), SQL.identifier(column)))
+            scores.append(SQL("word_similarity(n.%s, l.%s)", SQL.identifier(column), SQL.identifier(column)))
+
+        self.env.cr.execute(SQL(
+            """
+            SELECT n.lead_id, c.id
+              FROM unnest(%(lead_ids)s::int[], %(partner_ids)s::int[], %(needles)s)
+                   AS n(lead_id, partner_id, %(columns)s)
+        CROSS JOIN LATERAL (
+                SELECT ARRAY(
+                    SELECT o.res_id
+                      FROM btp_dedup_key k
+                      JOIN btp_dedup_key o
+                        ON o.key_type = k.key_type
+                       AND o.key_value = k.key_value
+                       AND o.res_model = k.res_model
+                     WHERE k.res_model = 'btp.lead'
+                       AND k.res_id = n.lead_id
+                       AND o.res_id != n.lead_id
+                ) AS ids
+                   ) b
+        CROSS JOIN LATERAL (
+                SELECT l.id, GREATEST(%(scores)s) AS score
+                  FROM btp_lead l
+                 WHERE l.active
+                   AND l.id != n.lead_id
+                   AND (%(conditions)s)
+              ORDER BY score DESC, l.id DESC
+                 LIMIT %(limit)s
+                   ) c
+          ORDER BY n.lead_id, c.score DESC, c.id DESC
+            """,
+            lead_ids=[lead.id for lead, _terms in needles],
+            partner_ids=[lead.partner_id.id or None for lead, _terms in needles],
+            needles=SQL(", ").join(
+                SQL("%s::varchar[]", [terms.get(column) for _lead, terms in needles])
+                for column in MATCH_COLUMNS
+            ),
+            columns=SQL(", ").join(SQL.identifier(column) for column in MATCH_COLUMNS),
+            scores=SQL(", ").join(scores),
+            conditions=SQL(" OR ").join(conditions),
+            limit=limit,
+        ))
+        for lead_id, duplicate_id in self.env.cr.fetchall():
+            result[lead_id].append(duplicate_id)
+        return result
+
+    @api.model
+    def _get_fallback_domain(self, lead, terms, key_match_ids=()):
+        """ilike domain used when pg_trgm is not available on the database"""
+        or_conditions = []
+        if key_match_ids:
+            or_conditions.append(('id', 'in', list(key_match_ids)))
+        if lead.partner_id:
+            or_conditions.append(('partner_id', '=', lead.partner_id.id))
+        for column, needle in terms.items():
+            or_conditions.append((column, 'ilike', needle))
+        if not or_conditions:
+            return []
+        return [('id', '!=', lead.id)] + ['|'] * (len(or_conditions) - 1) + or_conditions
+
+
+class BtpLeadDuplicateQueue(models.Model):
+    """Leads waiting for deferred duplicate detection
+
+    When ``btp_prospecting.duplicate_detection_deferred`` is set, lead
+    creation only enqueues the new leads; the queue cron detects and reports
+    their duplicates in batches, with the visibility of the creating user.
+    """
+    _name = 'btp.lead.duplicate.queue'
+    _description = 'BTP Lead Duplicate Detection Queue'
+    _order = 'id'
+
+    lead_id = fields.Many2one('btp.lead', string='Lead', required=True, index=True, ondelete='cascade')
+    user_id = fields.Many2one(
+        'res.users', string='Requested By', required=True, ondelete='cascade',
+        default=lambda self: self.env.uid,
+        help='Duplicates are linked and reported with the access rights of this user'
+    )
+
+    @api.model
+    def _is_deferred(self):
+        return str2bool(self.env['ir.config_parameter'].sudo().get_param(
+            'btp_prospecting.duplicate_detection_deferred', 'False'
+        ))
+
+    @api.model
+    def _enqueue(self, leads):
+        """Queue ``leads`` for duplicate detection and wake up the queue cron"""
+        if not leads:
+            return
+        self.sudo().create([{'lead_id': lead.id, 'user_id': self.env.uid} for lead in leads])
+        cron = self.env.ref('btp_prospecting.btp_lead_duplicate_queue_cron', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_process_queue(self):
+        """Run duplicate detection for queued leads, one batch at a time"""
+        Queue = self.sudo()
+        remaining = Queue.search_count([])
+        while remaining:
+            entries = Queue.search([], limit=QUEUE_BATCH_SIZE)
+            if not entries:
+                break
+            for user, user_entries in entries.grouped('user_id').items():
+                leads = user_entries.lead_id.with_user(user).with_company(user.company_id)
+                leads._detect_duplicates()
+            entries.unlink()
+            remaining = max(remaining - len(entries), 0)
+            if not self.env['ir.cron']._commit_progress(len(entries), remaining=remaining):
+                break
@@ -1,7 +1,112 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
+import re
+
+
+class CompiledAssignmentRule:
+    """Criteria of an assignment rule, reduced to plain sets for fast matching"""
+    __slots__ = (
+        'id', 'assignment_type', 'company_id', 'user_id', 'max_leads_per_month',
+        'country_ids', 'city_names', 'zip_prefix', 'zip_regex', 'category_ids', 'site_type',
+    )
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.assignment_type = rule.assignment_type
+        self.company_id = rule.company_id.id
+        self.user_id = rule.user_id.id
+        self.max_leads_per_month = rule.max_leads_per_month
+        self.country_ids = frozenset(rule.country_ids.ids)
+        self.city_names = frozenset(
+            c.strip().lower() for c in (rule.city_names or '').split('\n') if c.strip()
+        )
+        # "75*" or "75" are prefix patterns (looked up in the matcher trie),
+        # anything else is kept as a regex with the historical semantics
+        self.zip_prefix = None
+        self.zip_regex = None
+        pattern = rule.zip_code_pattern
+        if pattern:
+            prefix = pattern.rstrip('*')
+            if prefix and re.escape(prefix) == prefix:
+                self.zip_prefix = prefix
+            else:
+                self.zip_regex = re.compile(pattern.replace('*', '.*'))
+        self.category_ids = frozenset(rule.partner_category_ids.ids)
+        self.site_type = rule.site_type
+
+    def match(self, vals, company_id, zip_rule_ids, category_ids):
+        """Check the criteria of the rule (monthly limit excluded) against lead values
+
+        :param zip_rule_ids: ids of the prefix rules matching the lead ZIP code
+        :param category_ids: category ids of the lead partner
+        """
+        if self.company_id and self.company_id != company_id:
+            return False
+
+        # Manual only - don't auto-assign
+        if self.assignment_type == 'manual':
+            return False
+
+        if self.assignment_type == 'geography':
+            if self.country_ids and vals.get('site_country_id') not in self.country_ids:
+                return False
+            if self.city_names:
+                lead_city = (vals.get('site_city') or '').strip().lower()
+                if lead_city not in self.city_names:
+                    return False
+            if self.zip_prefix is not None and self.id not in zip_rule_ids:
+                return False
+            if self.zip_regex is not None and not (vals.get('site_zip') and self.zip_regex.match(vals['site_zip'])):
+                return False
+
+        elif self.assignment_type == 'client_type':
+            if self.category_ids and not (self.category_ids & category_ids):
+                return False
+
+        elif self.assignment_type == 'site_type':
+            site_type = vals.get('site_type')
+            if not site_type or site_type != self.site_type:
+                return False
+
+        # Round robin - always matches if no other criteria
+        return True
+
+
+class AssignmentMatcher:
+    """Active assignment rules of a company, compiled once and cached in the registry"""
+    __slots__ = ('rules', 'zip_trie')
+
+    def __init__(self, rules):
+        self.rules = tuple(CompiledAssignmentRule(rule) for rule in rules)
+        # Prefix trie of the ZIP patterns: {char: node}, rule ids stored under None
+        self.zip_trie = {}
+        for rule in self.rules:
+            if rule.zip_prefix is not None:
+                node = self.zip_trie
+                for char in rule.zip_prefix:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, set()).add(rule.id)
+
+    def zip_rule_ids(self, zip_code):
+        """Return the ids of the rules whose ZIP prefix matches ``zip_code``"""
+        rule_ids = set()
+        node = self.zip_trie
+        for char in zip_code or '':
+            node = node.get(char)
+            if node is None:
+                break
+            rule_ids.update(node.get(None, ()))
+        return rule_ids
+
+    def candidates(self, vals, company_id, category_ids):
+        """Yield the compiled rules matching lead values, by priority"""
+        zip_rule_ids = self.zip_rule_ids(vals.get('site_zip'))
+        for rule in self.rules:
+            if rule.match(vals, company_id, zip_rule_ids, category_ids):
+                yield rule
 
 
 class BtpLeadStage(models.Model):
@@ -143,8 +248,8 @@ class BtpLeadAssignmentRule(models.Model):
     # Round robin
     round_robin_count = fields.Integer(
         string='Round Robin Count',
-        default=0,
-        help='Current count for round-robin distribution'
+        compute='_compute_round_robin_count',
+        help='Number of leads distributed by round-robin (PostgreSQL sequence of the rule)'
     )
     
     # Company
@@ -167,101 +272,150 @@ class BtpLeadAssignmentRule(models.Model):
     
     @api.depends('user_id')
     def _compute_month_count(self):
+        counts = self.env['btp.lead.assignment.counter']._get_month_counts(self.ids)
         for rule in self:
             if rule.max_leads_per_month:
-                month_start = fields.Datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                rule.current_month_count = self.env['btp.lead'].search_count([
-                    ('assignment_rule_id', '=', rule.id),
-                    ('create_date', '>=', month_start),
-                ])
+                rule.current_month_count = counts.get(rule.id, 0)
             else:
                 rule.current_month_count = 0
+
+    def _compute_round_robin_count(self):
+        sequences = {rule._get_round_robin_sequence(): rule for rule in self if rule.id}
+        counts = {}
+        if sequences:
+            self.env.cr.execute(SQL(
+                "SELECT sequencename, COALESCE(last_value, start_value - 1) FROM pg_sequences WHERE sequencename = ANY(%s)",
+                list(sequences),
+            ))
+            counts = {sequences[name].id: count for name, count in self.env.cr.fetchall()}
+        for rule in self:
+            rule.round_robin_count = counts.get(rule.id, 0)
+
+    def _reserve_monthly_slot(self):
+        """Count a lead assignment for this month, within the monthly limit
+
+        Rules without limit are not counted: their captures must not queue
+        on the locked (rule, month) counter row.
+
+        :return: False when the limit of the rule is already reached
+        """
+        self.ensure_one()
+        if not self.max_leads_per_month:
+            return True
+        count = self.env['btp.lead.assignment.counter']._increment(self.id, self.max_leads_per_month)
+        self.invalidate_recordset(['current_month_count'])
+        return count is not None
     
+    def init(self):
+        # One round-robin sequence per rule; the legacy stored counter (if
+        # any) gives the starting position of rules created before sequences
+        cr = self.env.cr
+        has_legacy_count = tools.column_exists(cr, self._table, 'round_robin_count')
+        cr.execute(SQL(
+            "SELECT id, %s FROM btp_lead_assignment_rule",
+            SQL.identifier('round_robin_count') if has_legacy_count else SQL("0"),
+        ))
+        for rule_id, count in cr.fetchall():
+            self.browse(rule_id)._create_round_robin_sequence(count or 0)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        rules = super().create(vals_list)
+        for rule in rules:
+            rule._create_round_robin_sequence()
+        self.env.registry.clear_cache()
+        return rules
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        sequences = [rule._get_round_robin_sequence() for rule in self]
+        result = super().unlink()
+        for sequence in sequences:
+            self.env.cr.execute(SQL("DROP SEQUENCE IF EXISTS %s", SQL.identifier(sequence)))
+        self.env.registry.clear_cache()
+        return result
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_assignment_matcher(self, company_id):
+        """Return the compiled matcher of the active rules available to a company"""
+        rules = self.sudo().search([
+            ('active', '=', True),
+            ('company_id', 'in', [False, company_id]),
+        ], order='sequence, id')
+        return AssignmentMatcher(rules)
+
+    @api.model
+    def _get_matching_rules(self, vals, category_ids=frozenset()):
+        """Yield the rules (sudo) matching lead values by priority, monthly limits included"""
+        company_id = vals.get('company_id', self.env.company.id)
+        matcher = self._get_assignment_matcher(self.env.company.id)
+        for compiled in matcher.candidates(vals, company_id, category_ids):
+            rule = self.sudo().browse(compiled.id)
+            # Check limits (the slot itself is reserved atomically by _reserve_monthly_slot)
+            if compiled.max_leads_per_month and rule.current_month_count >= compiled.max_leads_per_month:
+                continue
+            yield rule
+
     def match(self, vals):
         """Check if lead values match this rule"""
         self.ensure_one()
-        
+
         if not self.active:
             return False
-        
-        # Check company
-        company_id = vals.get('company_id', self.env.company.id)
-        if self.company_id and self.company_id.id != company_id:
-            return False
-        
+
         # Check limits
         if self.max_leads_per_month and self.current_month_count >= self.max_leads_per_month:
             return False
-        
-        # Manual only - don't auto-assign
-        if self.assignment_type == 'manual':
-            return False
-        
-        # Geography
-        if self.assignment_type == 'geography':
-            if self.country_ids:
-                country_id = vals.get('site_country_id')
-                if not country_id or country_id not in self.country_ids.ids:
-                    return False
-            
-            if self.city_names:
-                city_names = [c.strip().lower() for c in self.city_names.split('\n') if c.strip()]
-                lead_city = vals.get('site_city', '').strip().lower()
-                if not lead_city or lead_city not in city_names:
-                    return False
-            
-            if self.zip_code_pattern:
-                zip_code = vals.get('site_zip', '')
-                if not zip_code or not self._match_pattern(zip_code, self.zip_code_pattern):
-                    return False
-        
-        # Client type
-        elif self.assignment_type == 'client_type':
-            if self.partner_category_ids:
-                partner_id = vals.get('partner_id')
-                if partner_id:
-                    partner = self.env['res.partner'].browse(partner_id)
-                    if not (partner.category_id & self.partner_category_ids):
-                        return False
-                else:
-                    return False
-        
-        # Site type
-        elif self.assignment_type == 'site_type':
-            site_type = vals.get('site_type')
-            if not site_type or site_type != self.site_type:
+
+        company_id = vals.get('company_id', self.env.company.id)
+        compiled = CompiledAssignmentRule(self)
+        category_ids = frozenset()
+        if self.assignment_type == 'client_type' and self.partner_category_ids:
+            if not vals.get('partner_id'):
                 return False
-        
-        # Round robin - always matches if no other criteria
-        elif self.assignment_type == 'round_robin':
-            # Round robin logic would be handled separately
-            pass
-        
-        return True
-    
+            category_ids = frozenset(self.env['res.partner'].browse(vals['partner_id']).category_id.ids)
+        zip_rule_ids = AssignmentMatcher(self).zip_rule_ids(vals.get('site_zip'))
+        return compiled.match(vals, company_id, zip_rule_ids, category_ids)
+
     def _match_pattern(self, value, pattern):
         """Match value against pattern (supports * wildcard)"""
-        import re
         pattern_re = pattern.replace('*', '.*')
         return bool(re.match(pattern_re, value))
     
-    def assign_round_robin(self):
-        """Assign lead using round-robin"""
+    def assign_round_robin(self, pool=None):
+        """Assign lead using smooth weighted round-robin
+
+        The position in the rotation comes from a PostgreSQL sequence owned by
+        the rule: ``nextval`` is not transactional and takes no row lock, so
+        concurrent lead captures never wait on each other.
+
+        :param pool: available users, when already computed by the caller
+        """
         self.ensure_one()
         if self.assignment_type != 'round_robin':
             return False
         
-        pool = self._get_round_robin_pool()
+        if pool is None:
+            pool = self._get_round_robin_pool()
         if not pool:
             return False
 
-        # Increment counter only when a valid pool exists
-        self.write({'round_robin_count': self.round_robin_count + 1})
-        index = (self.round_robin_count - 1) % len(pool)
-        return pool[index]
+        # Advance the rotation only when a valid pool exists
+        self.env.cr.execute(SQL("SELECT nextval(%s)", self._get_round_robin_sequence()))
+        position = self.env.cr.fetchone()[0]
+        self.invalidate_recordset(['round_robin_count'])
+        schedule = self._get_round_robin_schedule(tuple(
+            (user.id, max(user.btp_round_robin_weight or 1, 1)) for user in pool
+        ))
+        return pool.browse(schedule[(position - 1) % len(schedule)])
 
     def _get_round_robin_pool(self):
-        """Build weighted pool of available users for round-robin"""
+        """Return the available users (sorted by id) for round-robin"""
         self.ensure_one()
 
         if self.team_id:
@@ -271,17 +425,131 @@ class BtpLeadAssignmentRule(models.Model):
         else:
             candidates = self.user_id
 
-        if not candidates:
-            return []
-
         available = candidates.filtered(lambda u: not u.btp_is_unavailable and not u.btp_is_overloaded)
-        if not available:
-            return []
+        return available.sorted('id')
+
+    @api.model
+    @tools.ormcache('weights')
+    def _get_round_robin_schedule(self, weights):
+        """Return one full rotation of user ids for ((user id, weight), ...)
+
+        Smooth weighted round-robin: each user appears ``weight`` times per
+        rotation, interleaved with the others instead of in consecutive runs.
+        """
+        total = sum(weight for _user_id, weight in weights)
+        current = [0] * len(weights)
+        schedule = []
+        for _step in range(total):
+            for index, (_user_id, weight) in enumerate(weights):
+                current[index] += weight
+            best = max(range(len(weights)), key=lambda index: current[index])
+            current[best] -= total
+            schedule.append(weights[best][0])
+        return tuple(schedule)
+
+    def _get_round_robin_sequence(self):
+        self.ensure_one()
+        return f'btp_lead_assignment_rule_rr_{self.id}'
+
+    def _create_round_robin_sequence(self, count=0):
+        """Create the round-robin sequence of the rule, its next value being ``count + 1``"""
+        self.ensure_one()
+        self.env.cr.execute(SQL(
+            "CREATE SEQUENCE IF NOT EXISTS %s START WITH %s",
+            SQL.identifier(self._get_round_robin_sequence()), count + 1,
+        ))
+
+
+class BtpLeadAssignmentCounter(models.Model):
+    """Number of leads assigned by a rule per month
+
+    Incremented atomically when a rule assigns a lead, so that monthly limits
+    are checked with a single indexed row instead of counting leads, and
+    decremented when such a lead is deleted or moved to another user.
+    """
+    _name = 'btp.lead.assignment.counter'
+    _description = 'BTP Lead Assignment Monthly Counter'
+    _log_access = False
+
+    rule_id = fields.Many2one('btp.lead.assignment.rule', string='Rule', required=True, ondelete='cascade')
+    month = fields.Date(string='Month', required=True, help='First day of the month')
+    lead_count = fields.Integer(string='Assigned Leads', default=0)
+
+    def init(self):
+        cr = self.env.cr
+        tools.create_unique_index(cr, 'btp_lead_assignment_counter_rule_month_index', self._table, ['rule_id', 'month'])
+        cr.execute(SQL("SELECT 1 FROM btp_lead_assignment_counter LIMIT 1"))
+        if not cr.fetchone() and tools.column_exists(cr, 'btp_lead', 'assignment_rule_id'):
+            # Installation/upgrade: count the leads already assigned this month
+            cr.execute(SQL(
+                """
+                INSERT INTO btp_lead_assignment_counter (rule_id, month, lead_count)
+                     SELECT assignment_rule_id, %(month)s, COUNT(*)
+                       FROM btp_lead
+                      WHERE assignment_rule_id IS NOT NULL
+                        AND create_date >= %(month)s
+                   GROUP BY assignment_rule_id
+                """,
+                month=self._get_current_month(),
+            ))
+
+    @api.model
+    def _get_current_month(self):
+        return fields.Date.today().replace(day=1)
+
+    @api.model
+    def _get_month_counts(self, rule_ids):
+        """Return {rule id: leads assigned this month} for ``rule_ids``"""
+        if not rule_ids:
+            return {}
+        self.env.cr.execute(SQL(
+            "SELECT rule_id, lead_count FROM btp_lead_assignment_counter WHERE rule_id = ANY(%s) AND month = %s",
+            list(rule_ids), self._get_current_month(),
+        ))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _increment(self, rule_id, limit=0):
+        """Atomically count one more lead for ``rule_id`` this month
 
-        weighted_pool = []
-        for user in available:
-            weight = max(user.btp_round_robin_weight or 1, 1)
-            weighted_pool.extend([user] * weight)
+        :param limit: monthly limit of the rule (0 = unlimited)
+        :return: the new count, or None when the limit is already reached
+        """
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO btp_lead_assignment_counter AS c (rule_id, month, lead_count)
+                 VALUES (%(rule_id)s, %(month)s, 1)
+            ON CONFLICT (rule_id, month)
+              DO UPDATE SET lead_count = c.lead_count + 1
+                      WHERE %(limit)s = 0 OR c.lead_count < %(limit)s
+              RETURNING lead_count
+            """,
+            rule_id=rule_id,
+            month=self._get_current_month(),
+            limit=limit or 0,
+        ))
+        row = self.env.cr.fetchone()
+        self.invalidate_model(['lead_count'])
+        return row[0] if row else None
 
-        return weighted_pool
+    @api.model
+    def _decrement(self, counts):
+        """Give back assignments counted this month, e.g. of deleted or reassigned leads
 
+        :param counts: {rule id: number of leads}
+        """
+        if not counts:
+            return
+        self.env.cr.execute(SQL(
+            """
+            UPDATE btp_lead_assignment_counter c
+               SET lead_count = GREATEST(c.lead_count - u.lead_count, 0)
+              FROM unnest(%(rule_ids)s::int[], %(counts)s::int[]) AS u(rule_id, lead_count)
+             WHERE c.rule_id = u.rule_id
+               AND c.month = %(month)s
+            """,
+            rule_ids=list(counts),
+            counts=list(counts.values()),
+            month=self._get_current_month(),
+        ))
+        self.invalidate_model(['lead_count'])
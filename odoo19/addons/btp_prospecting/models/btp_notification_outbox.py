@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DIGEST_BATCH_SIZE = 50
+
+
+class BtpNotificationOutbox(models.Model):
+    """Pending email notifications of the BTP crons
+
+    Reminders, escalations and loop reminders are not mailed one by one:
+    they are stored here and the digest cron sends each recipient a single
+    email listing all their pending notifications, queued in the mail queue.
+    """
+    _name = 'btp.notification.outbox'
+    _description = 'BTP Notification Outbox'
+    _order = 'user_id, notification_type, id'
+
+    user_id = fields.Many2one('res.users', string='Recipient', required=True, index=True, ondelete='cascade')
+    lead_id = fields.Many2one('btp.lead', string='Lead', required=True, ondelete='cascade')
+    notification_type = fields.Selection([
+        ('reminder', 'Lead Reminder'),
+        ('escalation', 'Lead Escalation'),
+        ('loop_reminder', '6-Month Loop Reminder'),
+    ], string='Type', required=True)
+
+    @api.model
+    def _enqueue(self, notification_type, leads_by_user):
+        """Store notifications for {recipient user: lead ids}, recipients without email excluded"""
+        vals_list = [
+            {'user_id': user.id, 'lead_id': lead_id, 'notification_type': notification_type}
+            for user, lead_ids in leads_by_user.items()
+            if user.email
+            for lead_id in lead_ids
+        ]
+        return self.sudo().create(vals_list)
+
+    @api.model
+    def _cron_send_digests(self):
+        """Queue one digest email per recipient for all pending notifications"""
+        template = self.env.ref('btp_prospecting.email_template_notification_digest', raise_if_not_found=False)
+        if not template:
+            return True
+        Outbox = self.sudo()
+        user_ids = [user.id for (user,) in Outbox._read_group([], ['user_id'])]
+        remaining = len(user_ids)
+        for index in range(0, len(user_ids), DIGEST_BATCH_SIZE):
+            batch_user_ids = user_ids[index:index + DIGEST_BATCH_SIZE]
+            entries = Outbox.search([('user_id', 'in', batch_user_ids)])
+            for user, user_entries in entries.grouped('user_id').items():
+                # The body is rendered now, the entries can be dropped right after
+                template.with_context(btp_outbox_ids=user_entries.ids).send_mail(user.id, force_send=False)
+            entries.unlink()
+            remaining -= len(batch_user_ids)
+            if not self.env['ir.cron']._commit_progress(len(batch_user_ids), remaining=remaining):
+                break
+        return True
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import AccessError, UserError
+from odoo.tools import SQL
+import csv
+import gzip
+import io
+import itertools
+import logging
+import time
+import zipfile
+
+from .btp_company_hierarchy import identifier_predicate
+
+_logger = logging.getLogger(__name__)
+
+# Building and public works divisions of the NAF rev. 2 nomenclature
+DEFAULT_NAF_PREFIXES = '41,42,43'
+IMPORT_CHUNK_SIZE = 5000
+# Stored res.partner columns filled by the importer itself
+IMPORTED_PARTNER_COLUMNS = (
+    'name', 'siren', 'siret', 'naf_code', 'legal_form', 'is_company', 'company_id',
+    'btp_api_source', 'btp_api_enriched',
+)
+LOG_ACCESS_COLUMNS = ('create_uid', 'create_date', 'write_uid', 'write_date')
+
+
+def open_stock_file(path):
+    """Open a Sirene stock file (CSV, gzipped CSV or single-member zip) as text"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if path.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        member = next(name for name in archive.namelist() if name.endswith('.csv'))
+        return io.TextIOWrapper(archive.open(member), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def compact_naf(value):
+    """Return the NAF code without separator ('43.21A' -> '4321A')"""
+    return (value or '').replace('.', '').strip()
+
+
+def join_address(*parts):
+    return ' '.join(part.strip() for part in parts if part and part.strip()) or None
+
+
+def person_name(first_name, last_name):
+    """Return the name of a sole proprietorship ('Jean', 'DUPONT' -> 'Jean DUPONT')"""
+    first_name, last_name = (first_name or '').strip(), (last_name or '').strip()
+    return f'{first_name} {last_name}'.strip() or None
+
+
+class BtpSireneImporter(models.AbstractModel):
+    """Bulk loader for the INSEE Sirene stock files
+
+    Reads StockUniteLegale / StockEtablissement extracts from a local file,
+    streamed in chunks and filtered on the NAF code, and upserts them with
+    one statement per chunk instead of going through ``res.partner.create``
+    (no duplicate checks, API enrichment nor career history). Legal units
+    become companies keyed by SIREN; establishments become addresses of
+    their company, linked by the SIREN prefix of their SIRET.
+    """
+    _name = 'btp.sirene.importer'
+    _description = 'BTP INSEE Sirene Stock Importer'
+
+    @api.model
+    def _get_naf_prefixes(self):
+        prefixes = self.env['ir.config_parameter'].sudo().get_param(
+            'btp_prospecting.sirene_naf_prefixes', DEFAULT_NAF_PREFIXES
+        )
+        return tuple(prefix.strip() for prefix in prefixes.split(',') if prefix.strip())
+
+    @api.model
+    def _check_import_access(self):
+        """Stock files are read from the server filesystem: administrators only"""
+        if not (self.env.is_superuser() or self.env.user.has_group('base.group_system')):
+            raise AccessError(_('Only administrators can import the Sirene stock files.'))
+
+    @api.model
+    def _read_chunks(self, path, parse_row, chunk_size, skip=0):
+        """Yield (rows read, parsed rows) chunks; ``parse_row`` returns None to skip a row
+
+        :param skip: number of data rows to skip first (resumed import)
+        """
+        with open_stock_file(path) as stock:
+            reader = csv.DictReader(stock)
+            for _row in itertools.islice(reader, skip):
+                pass
+            while True:
+                rows = list(itertools.islice(reader, chunk_size))
+                if not rows:
+                    return
+                yield len(rows), [parsed for parsed in map(parse_row, rows) if parsed]
+
+    @api.model
+    def _run(self, label, path, parse_row, upsert, chunk_size, skip=0):
+        """Stream ``path`` through ``upsert`` and log the throughput
+
+        Each chunk is committed when running from a cron; when the cron runs
+        out of time, the import stops with ``stats['interrupted']`` and
+        ``stats['next_row']`` is the ``skip`` that resumes it.
+        """
+        stats = {'read': 0, 'kept': 0, 'inserted': 0, 'updated': 0, 'interrupted': False}
+        started = time.monotonic()
+        for read_count, rows in self._read_chunks(path, parse_row, chunk_size, skip=skip):
+            stats['read'] += read_count
+            stats['kept'] += len(rows)
+            if rows:
+                inserted, updated = upsert(rows)
+                stats['inserted'] += inserted
+                stats['updated'] += updated
+            if not self.env['ir.cron']._commit_progress(read_count):
+                stats['interrupted'] = True
+                break
+        stats['next_row'] = skip + stats['read']
+        stats['seconds'] = round(time.monotonic() - started, 1)
+        stats['rows_per_second'] = round(stats['read'] / stats['seconds']) if stats['seconds'] else stats['read']
+        _logger.info(
+            'Sirene %s import of %s: %d rows read, %d kept, %d inserted, %d updated in %ss (%d rows/s)',
+            label, path, stats['read'], stats['kept'], stats['inserted'], stats['updated'],
+            stats['seconds'], stats['rows_per_second'],
+        )
+        return stats
+
+    @api.model
+    def _cron_import_stock_files(self):
+        """Import the stock files of ``btp_prospecting.sirene_legal_units_path`` and
+        ``btp_prospecting.sirene_establishments_path``, companies first
+
+        An import stopped by the cron time limit is recorded in
+        ``btp_prospecting.sirene_import_resume`` ('<kind>:<row>') and the cron
+        is triggered again to resume it.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        resume_kind, _sep, resume_row = (ICP.get_param('btp_prospecting.sirene_import_resume') or '').partition(':')
+        kinds = [('legal_units', self._import_legal_units), ('establishments', self._import_establishments)]
+        if resume_kind in dict(kinds):
+            kinds = kinds[[kind for kind, _import in kinds].index(resume_kind):]
+        for kind, import_file in kinds:
+            path = ICP.get_param(f'btp_prospecting.sirene_{kind}_path')
+            if not path:
+                continue
+            stats = import_file(path, skip=int(resume_row or 0) if kind == resume_kind else 0)
+            if stats['interrupted']:
+                ICP.set_param('btp_prospecting.sirene_import_resume', f"{kind}:{stats['next_row']}")
+                self.env.ref('btp_prospecting.btp_sirene_import_cron')._trigger()
+                return True
+        ICP.set_param('btp_prospecting.sirene_import_resume', False)
+        return True
+
+    # ========== Legal units (StockUniteLegale) ==========
+
+    @api.model
+    def _import_legal_units(self, path, chunk_size=IMPORT_CHUNK_SIZE, skip=0):
+        """Upsert the active legal units of the configured NAF divisions as companies
+
+        :param skip: number of data rows to skip, to resume an interrupted import
+        :return: dict of statistics (rows read/kept/inserted/updated, rows per second)
+        """
+        self._check_import_access()
+        Partner = self.env['res.partner']
+        if not tools.index_exists(self.env.cr, 'res_partner_company_siren_unique'):
+            raise UserError(_(
+                'Sirene import requires unique company SIRENs: remove the duplicate SIRENs '
+                'and upgrade the module first.'
+            ))
+        naf_prefixes = self._get_naf_prefixes()
+
+        def parse_row(row):
+            naf_code = compact_naf(row.get('activitePrincipaleUniteLegale'))
+            if row.get('etatAdministratifUniteLegale') != 'A' or not naf_code.startswith(naf_prefixes):
+                return None
+            name = (
+                row.get('denominationUniteLegale')
+                or row.get('denominationUsuelle1UniteLegale')
+                or person_name(row.get('prenom1UniteLegale'), row.get('nomUniteLegale'))
+            )
+            siren = row.get('siren')
+            if not name or not siren:
+                return None
+            nic = row.get('nicSiegeUniteLegale')
+            return (
+                name.strip(), siren, f'{siren}{nic.zfill(5)}' if nic else None,
+                naf_code, row.get('categorieJuridiqueUniteLegale') or None,
+            )
+
+        Partner.flush_model()
+        defaults = self._get_partner_defaults()
+        return self._run(
+            'legal unit', path, parse_row, lambda rows: self._upsert_companies(rows, defaults), chunk_size, skip=skip,
+        )
+
+    @api.model
+    def _get_partner_defaults(self):
+        """Return {column: value} of the defaults of the other stored partner columns"""
+        Partner = self.env['res.partner']
+        names = [
+            name for name, field in Partner._fields.items()
+            if field.store and field.column_type and not field.compute
+            and name != 'id' and name not in IMPORTED_PARTNER_COLUMNS + LOG_ACCESS_COLUMNS
+        ]
+        defaults = Partner.default_get(names)
+        return {
+            name: Partner._fields[name].convert_to_column_insert(value, Partner, defaults)
+            for name, value in defaults.items()
+        }
+
+    @api.model
+    def _upsert_companies(self, rows, defaults):
+        """Insert or update one chunk of (name, siren, siret, naf code, legal form)"""
+        Partner = self.env['res.partner']
+        columns = [*defaults, *IMPORTED_PARTNER_COLUMNS, *LOG_ACCESS_COLUMNS]
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO res_partner (%(columns)s)
+            SELECT %(defaults)s u.name, u.siren, u.siret, u.naf_code, u.legal_form, TRUE, NULL,
+                   'insee', TRUE, %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM unnest(%(names)s::varchar[], %(sirens)s::varchar[], %(sirets)s::varchar[],
+                          %(naf_codes)s::varchar[], %(legal_forms)s::varchar[])
+                   AS u(name, siren, siret, naf_code, legal_form)
+                ON CONFLICT (siren) WHERE %(predicate)s
+         DO UPDATE SET name = EXCLUDED.name,
+                       siret = COALESCE(res_partner.siret, EXCLUDED.siret),
+                       naf_code = EXCLUDED.naf_code,
+                       legal_form = EXCLUDED.legal_form,
+                       btp_api_source = 'insee',
+                       btp_api_enriched = TRUE,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+         RETURNING id, xmax = 0
+            """,
+            columns=SQL(", ").join(SQL.identifier(column) for column in columns),
+            defaults=SQL("").join(SQL("%s, ", value) for value in defaults.values()),
+            uid=self.env.uid,
+            now=fields.Datetime.now(),
+            names=[row[0] for row in rows],
+            sirens=[row[1] for row in rows],
+            sirets=[row[2] for row in rows],
+            naf_codes=[row[3] for row in rows],
+            legal_forms=[row[4] for row in rows],
+            predicate=identifier_predicate('siren', 'is_company'),
+        ))
+        result = self.env.cr.fetchall()
+        inserted = Partner.browse([partner_id for partner_id, is_new in result if is_new])
+        updated = Partner.browse([partner_id for partner_id, is_new in result if not is_new])
+        self._recompute_imported(Partner, inserted, updated, ['name', 'siret', 'naf_code', 'legal_form', 'btp_api_source'])
+        return len(inserted), len(updated)
+
+    # ========== Establishments (StockEtablissement) ==========
+
+    @api.model
+    def _import_establishments(self, path, chunk_size=IMPORT_CHUNK_SIZE, skip=0):
+        """Upsert the open establishments of the configured NAF divisions as company addresses
+
+        Establishments are attached to the company whose SIREN is the prefix
+        of their SIRET (those without an imported company are dropped); the
+        headquarters address is also copied on companies sourced from INSEE.
+
+        :param skip: number of data rows to skip, to resume an interrupted import
+        :return: dict of statistics (rows read/kept/inserted/updated, rows per second)
+        """
+        self._check_import_access()
+        if not tools.index_exists(self.env.cr, 'btp_company_address_siret_unique'):
+            raise UserError(_(
+                'Sirene import requires unique address SIRETs: remove the duplicate SIRETs '
+                'and upgrade the module first.'
+            ))
+        naf_prefixes = self._get_naf_prefixes()
+        country = self.env.ref('base.fr', raise_if_not_found=False)
+
+        def parse_row(row):
+            naf_code = compact_naf(row.get('activitePrincipaleEtablissement'))
+            siret = row.get('siret')
+            if row.get('etatAdministratifEtablissement') != 'A' or not siret or not naf_code.startswith(naf_prefixes):
+                return None
+            return (
+                siret,
+                row.get('etablissementSiege') == 'true',
+                row.get('enseigne1Etablissement') or row.get('denominationUsuelleEtablissement') or None,
+                join_address(
+                    row.get('numeroVoieEtablissement'), row.get('indiceRepetitionEtablissement'),
+                    row.get('typeVoieEtablissement'), row.get('libelleVoieEtablissement'),
+                ),
+                row.get('complementAdresseEtablissement') or None,
+                row.get('codePostalEtablissement') or None,
+                row.get('libelleCommuneEtablissement') or None,
+            )
+
+        self.env['res.partner'].flush_model()
+        self.env['btp.company.address'].flush_model()
+        return self._run(
+            'establishment', path, parse_row,
+            lambda rows: self._upsert_establishments(rows, country.id if country else None),
+            chunk_size, skip=skip,
+        )
+
+    @api.model
+    def _upsert_establishments(self, rows, country_id):
+        """Insert or update one chunk of establishment addresses"""
+        Partner = self.env['res.partner']
+        Address = self.env['btp.company.address']
+        now = fields.Datetime.now()
+        unnested = SQL(
+            """
+            unnest(%s::varchar[], %s::bool[], %s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[])
+                AS u(siret, is_hq, name, street, street2, zip, city)
+            """,
+            *[[row[index] for row in rows] for index in range(7)],
+        )
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO btp_company_address (partner_id, address_type, name, siret, street, street2, zip, city,
+                                             country_id, active, create_uid, create_date, write_uid, write_date)
+                 SELECT p.id, CASE WHEN u.is_hq THEN 'hq' ELSE 'agency' END, COALESCE(u.name, u.siret), u.siret,
+                        u.street, u.street2, u.zip, u.city, %(country)s, TRUE, %(uid)s, %(now)s, %(uid)s, %(now)s
+                   FROM %(unnested)s
+                   JOIN res_partner p ON p.siren = left(u.siret, 9) AND %(predicate)s
+                     ON CONFLICT (siret) WHERE %(address_predicate)s
+              DO UPDATE SET partner_id = EXCLUDED.partner_id,
+                            address_type = EXCLUDED.address_type,
+                            name = EXCLUDED.name,
+                            street = EXCLUDED.street,
+                            street2 = EXCLUDED.street2,
+                            zip = EXCLUDED.zip,
+                            city = EXCLUDED.city,
+                            write_uid = EXCLUDED.write_uid,
+                            write_date = EXCLUDED.write_date
+              RETURNING id, xmax = 0
+            """,
+            unnested=unnested,
+            country=country_id,
+            uid=self.env.uid,
+            now=now,
+            predicate=identifier_predicate('siren', 'is_company', alias='p'),
+            address_predicate=identifier_predicate('siret'),
+        ))
+        result = self.env.cr.fetchall()
+        Address.invalidate_model()
+
+        # Headquarters address of the companies loaded from the stock files
+        self.env.cr.execute(SQL(
+            """
+            UPDATE res_partner p
+               SET street = u.street, street2 = u.street2, zip = u.zip, city = u.city,
+                   country_id = COALESCE(%(country)s, p.country_id), write_uid = %(uid)s, write_date = %(now)s
+              FROM %(unnested)s
+             WHERE u.is_hq
+               AND p.siren = left(u.siret, 9)
+               AND %(predicate)s
+               AND p.btp_api_source = 'insee'
+         RETURNING p.id
+            """,
+            unnested=unnested,
+            country=country_id,
+            uid=self.env.uid,
+            now=now,
+            predicate=identifier_predicate('siren', 'is_company', alias='p'),
+        ))
+        companies = Partner.browse([row[0] for row in self.env.cr.fetchall()])
+        self._recompute_imported(Partner, Partner, companies, ['street', 'street2', 'zip', 'city', 'country_id'])
+        inserted = sum(1 for _address_id, is_new in result if is_new)
+        return inserted, len(result) - inserted
+
+    @api.model
+    def _recompute_imported(self, model, inserted, updated, fnames):
+        """Bring the ORM up to date after raw upserts: caches, stored computes and dependents"""
+        model.invalidate_model()
+        for field in model._fields.values():
+            if field.store and field.compute:
+                self.env.add_to_compute(field, inserted)
+        (inserted | updated).modified(fnames)
+        model.flush_model()
+        model.invalidate_model()
@@ -12,6 +12,7 @@ class BtpSupplierDocument(models.Model):
     """Document for suppliers/subcontractors (URSSAF, taxes, insurances, paid vacations)"""
     _name = 'btp.supplier.document'
     _description = 'Supplier Document'
+    _inherit = ['btp.document.expiry.mixin']
     _order = 'supplier_id, document_type, expiration_date'
 
     name = fields.Char(
@@ -50,6 +51,7 @@ class BtpSupplierDocument(models.Model):
     expiration_date = fields.Date(
         string='Expiration Date',
         required=True,
+        index=True,
         help='Date when the document expires'
     )
     attachment_id = fields.Many2one(
@@ -107,6 +109,7 @@ class BtpSupplierDocument(models.Model):
     @api.model
     def _check_document_expiration(self):
         """Cron job: Check for expiring supplier documents and create activities"""
+        self._refresh_expiry_flags()
         today = fields.Date.today()
         warning_date = today + timedelta(days=30)
         
@@ -125,45 +128,30 @@ class BtpSupplierDocument(models.Model):
         # Create activities for expiring documents
         activity_type = self.env.ref('mail.mail_activity_data_todo', raise_if_not_found=False)
         if activity_type:
-            for doc in expiring_docs:
-                # Check if activity already exists
-                existing = self.env['mail.activity'].search([
-                    ('res_model', '=', 'res.partner'),
-                    ('res_id', '=', doc.supplier_id.id),
-                    ('activity_type_id', '=', activity_type.id),
-                    ('summary', 'ilike', f'Document {doc.name}'),
-                ], limit=1)
-                
-                if not existing:
-                    self.env['mail.activity'].create({
-                        'res_model': 'res.partner',
-                        'res_id': doc.supplier_id.id,
-                        'activity_type_id': activity_type.id,
-                        'summary': _('Document "%s" expires on %s') % (doc.name, doc.expiration_date),
-                        'note': _('Document type: %s\nReference: %s') % (dict(doc._fields['document_type'].selection)[doc.document_type], doc.reference or 'N/A'),
-                        'date_deadline': doc.expiration_date,
-                        'user_id': doc.supplier_id.user_id.id or doc.supplier_id.create_uid.id or self.env.user.id,
-                    })
+            document_types = dict(self._fields['document_type'].selection)
+            vals_list = [{
+                'res_model': 'res.partner',
+                'res_id': doc.supplier_id.id,
+                'activity_type_id': activity_type.id,
+                'summary': _('Document "%s" expires on %s') % (doc.name, doc.expiration_date),
+                'note': _('Document type: %s\nReference: %s') % (document_types[doc.document_type], doc.reference or 'N/A'),
+                'date_deadline': doc.expiration_date,
+                'user_id': doc.supplier_id.user_id.id or doc.supplier_id.create_uid.id or self.env.user.id,
+                'btp_dedup_key': f'{doc._name}:{doc.id}:expiring',
+            } for doc in expiring_docs]
             
             # Create activities for expired documents
-            for doc in expired_docs:
-                existing = self.env['mail.activity'].search([
-                    ('res_model', '=', 'res.partner'),
-                    ('res_id', '=', doc.supplier_id.id),
-                    ('activity_type_id', '=', activity_type.id),
-                    ('summary', 'ilike', f'Document {doc.name} EXPIRED'),
-                ], limit=1)
-                
-                if not existing:
-                    self.env['mail.activity'].create({
-                        'res_model': 'res.partner',
-                        'res_id': doc.supplier_id.id,
-                        'activity_type_id': activity_type.id,
-                        'summary': _('Document "%s" EXPIRED on %s') % (doc.name, doc.expiration_date),
-                        'note': _('Document type: %s\nReference: %s\n⚠️ This document has expired!') % (dict(doc._fields['document_type'].selection)[doc.document_type], doc.reference or 'N/A'),
-                        'date_deadline': doc.expiration_date,
-                        'user_id': doc.supplier_id.user_id.id or doc.supplier_id.create_uid.id or self.env.user.id,
-                    })
+            vals_list += [{
+                'res_model': 'res.partner',
+                'res_id': doc.supplier_id.id,
+                'activity_type_id': activity_type.id,
+                'summary': _('Document "%s" EXPIRED on %s') % (doc.name, doc.expiration_date),
+                'note': _('Document type: %s\nReference: %s\n⚠️ This document has expired!') % (document_types[doc.document_type], doc.reference or 'N/A'),
+                'date_deadline': doc.expiration_date,
+                'user_id': doc.supplier_id.user_id.id or doc.supplier_id.create_uid.id or self.env.user.id,
+                'btp_dedup_key': f'{doc._name}:{doc.id}:expired',
+            } for doc in expired_docs]
+            self.env['btp.activity.scheduler'].schedule(vals_list)
         
         return len(expiring_docs) + len(expired_docs)
 
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools
+from odoo.tools import SQL
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class BtpUserHierarchy(models.Model):
+    """Closure table of the pyramidal user hierarchy
+
+    One row per (manager, direct or indirect subordinate) pair, with the
+    distance between them. Maintained incrementally when ``manager_id`` of a
+    user changes, so that visibility rules are a single indexed subquery.
+    """
+    _name = 'btp.user.hierarchy'
+    _description = 'BTP User Hierarchy (Closure)'
+    _log_access = False
+
+    manager_id = fields.Many2one('res.users', string='Manager', required=True, ondelete='cascade')
+    subordinate_id = fields.Many2one('res.users', string='Subordinate', required=True, ondelete='cascade')
+    depth = fields.Integer(string='Depth', required=True, help='1 for direct subordinates')
+
+    def init(self):
+        cr = self.env.cr
+        tools.create_unique_index(cr, 'btp_user_hierarchy_manager_subordinate_index', self._table, ['manager_id', 'subordinate_id'])
+        tools.create_index(cr, 'btp_user_hierarchy_subordinate_index', self._table, ['subordinate_id'])
+        if tools.column_exists(cr, 'res_users', 'manager_id'):
+            self._rebuild()
+
+    @api.model
+    def _rebuild(self):
+        """Recompute the whole closure from ``res.users.manager_id``"""
+        self.env['res.users'].flush_model(['manager_id'])
+        self.env.cr.execute(SQL(
+            """
+            DELETE FROM btp_user_hierarchy;
+            INSERT INTO btp_user_hierarchy (manager_id, subordinate_id, depth)
+            WITH RECURSIVE closure(manager_id, subordinate_id, depth, path) AS (
+                SELECT manager_id, id, 1, ARRAY[id]
+                  FROM res_users
+                 WHERE manager_id IS NOT NULL
+                 UNION ALL
+                SELECT u.manager_id, c.subordinate_id, c.depth + 1, c.path || u.id
+                  FROM closure c
+                  JOIN res_users u ON u.id = c.manager_id
+                 WHERE u.manager_id IS NOT NULL
+                   AND u.id != ALL(c.path)
+            )
+            SELECT manager_id, subordinate_id, MIN(depth)
+              FROM closure
+             WHERE manager_id != subordinate_id
+          GROUP BY manager_id, subordinate_id
+            """
+        ))
+        self._invalidate_hierarchy()
+        _logger.info('Rebuilt BTP user hierarchy closure table')
+
+    @api.model
+    def _move_subtree(self, user_id, manager_id):
+        """Attach ``user_id`` and its whole subtree under ``manager_id`` (or detach it)"""
+        cr = self.env.cr
+        # Drop the links between the subtree and its former superiors
+        cr.execute(SQL(
+            """
+            WITH subtree AS (
+                SELECT subordinate_id AS id FROM btp_user_hierarchy WHERE manager_id = %(user)s
+                 UNION ALL
+                SELECT %(user)s
+            )
+            DELETE FROM btp_user_hierarchy
+             WHERE subordinate_id IN (SELECT id FROM subtree)
+               AND manager_id NOT IN (SELECT id FROM subtree)
+            """,
+            user=user_id,
+        ))
+        if manager_id:
+            # Link every superior of the new manager (and the manager itself)
+            # to every member of the subtree (and the user itself)
+            cr.execute(SQL(
+                """
+                INSERT INTO btp_user_hierarchy (manager_id, subordinate_id, depth)
+                     SELECT superior.id, member.id, superior.depth + member.depth + 1
+                       FROM (SELECT manager_id AS id, depth FROM btp_user_hierarchy WHERE subordinate_id = %(manager)s
+                              UNION ALL
+                             SELECT %(manager)s, 0) superior
+                 CROSS JOIN (SELECT subordinate_id AS id, depth FROM btp_user_hierarchy WHERE manager_id = %(user)s
+                              UNION ALL
+                             SELECT %(user)s, 0) member
+                ON CONFLICT DO NOTHING
+                """,
+                user=user_id,
+                manager=manager_id,
+            ))
+        self._invalidate_hierarchy()
+
+    @api.model
+    def _invalidate_hierarchy(self):
+        self.invalidate_model()
+        self.env['res.users'].invalidate_model(['all_subordinate_ids', 'btp_superior_link_ids'])
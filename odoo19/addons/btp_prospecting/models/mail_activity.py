@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields
+
+
+class MailActivity(models.Model):
+    """Extend activities with a deduplication key for BTP automated activities"""
+    _inherit = 'mail.activity'
+
+    btp_dedup_key = fields.Char(
+        string='BTP Deduplication Key',
+        index='btree_not_null',
+        copy=False,
+        help='Identifies an automated BTP activity so that crons do not schedule it twice '
+             '(see btp.activity.scheduler)'
+    )
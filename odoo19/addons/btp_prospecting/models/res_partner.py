@@ -1,12 +1,32 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
+from collections import defaultdict
+from datetime import timedelta
 import logging
 import re
+import time
+
+from .btp_company_hierarchy import check_identifier_conflicts, create_identifier_unique_index
+from .btp_dedup_key import CONTACT_DEDUP_FIELDS, contact_dedup_keys
+from .btp_lead_duplicate import ensure_trigram, normalize_text
 
 _logger = logging.getLogger(__name__)
 
+# Order in which contact duplicate criteria are reported
+CONTACT_MATCH_PRIORITY = ('email', 'phone', 'name')
+ENRICHMENT_BATCH_SIZE = 50
+ENRICHMENT_WORKERS = 4
+ENRICHMENT_REFRESH_DAYS = 90
+# Fields updated by the refresh cron; the others may have been edited by users since the first enrichment
+ENRICHMENT_REFRESH_FIELDS = ('naf_code', 'legal_form', 'street', 'zip', 'city')
+COMPANY_IDENTIFIER_FIELDS = ('siren', 'siret')
+NAME_NORMALIZATION_BATCH_SIZE = 50000
+SIREN_PATTERN = re.compile(r'^\d{9}$')
+SIRET_PATTERN = re.compile(r'^\d{14}$')
+
 
 class ResPartner(models.Model):
     """Extend res.partner for BTP Company and Contact management"""
@@ -166,6 +186,13 @@ class ResPartner(models.Model):
         help='Message explaining potential duplicate'
     )
     
+    # Normalized copy used by the company search engine (trigram indexed, see init)
+    btp_name_normalized = fields.Char(
+        compute='_compute_btp_name_normalized',
+        store=True,
+        help='Lowercased, unaccented company name used by the company search'
+    )
+
     # API enrichment
     btp_api_enriched = fields.Boolean(
         string='API Enriched',
@@ -178,6 +205,18 @@ class ResPartner(models.Model):
         ('infogreffe', 'Infogreffe'),
         ('manual', 'Manual Entry'),
     ], string='Data Source', default='manual')
+    btp_enrichment_state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Enriched'),
+        ('not_found', 'No Data Found'),
+        ('failed', 'Failed'),
+    ], string='Enrichment', index='btree_not_null', copy=False,
+        help='Background API enrichment of the company, queued at creation'
+    )
+    btp_enrichment_date = fields.Datetime(
+        string='Last Enrichment', index=True, copy=False,
+        help='Last time the company data was fetched from the external APIs'
+    )
 
     # ========== Supplier/Subcontractor Fields ==========
     # Note: Temporarily commented out to allow server startup
@@ -262,14 +301,19 @@ class ResPartner(models.Model):
             partner.btp_is_client = not partner.btp_is_prospect and has_orders
 
     def _compute_contact_count(self):
+        """Count the contacts of all companies in ``self`` with one grouped query"""
+        company_ids = [partner._origin.id for partner in self if partner.is_company and partner._origin.id]
+        counts = {}
+        if company_ids:
+            counts = {
+                parent.id: count
+                for parent, count in self.env['res.partner'].sudo()._read_group(
+                    [('parent_id', 'in', company_ids), ('is_company', '=', False)],
+                    ['parent_id'], ['__count'],
+                )
+            }
         for partner in self:
-            if partner.is_company:
-                partner.btp_contact_count = self.env['res.partner'].sudo().search_count([
-                    ('parent_id', '=', partner.id),
-                    ('is_company', '=', False)
-                ])
-            else:
-                partner.btp_contact_count = 0
+            partner.btp_contact_count = counts.get(partner._origin.id, 0) if partner.is_company else 0
 
     @api.depends('btp_supplier_document_ids', 'btp_supplier_document_ids.is_expired', 'btp_supplier_document_ids.expires_soon')
     def _compute_supplier_document_count(self):
@@ -303,39 +347,128 @@ class ResPartner(models.Model):
                 partner.btp_duplicate_warning = False
                 partner.btp_duplicate_message = False
     
+    def _auto_init(self):
+        # A new stored computed column is recomputed through the ORM for every
+        # partner; create and fill it with batched SQL updates instead
+        if not tools.column_exists(self.env.cr, self._table, 'btp_name_normalized'):
+            tools.create_column(self.env.cr, self._table, 'btp_name_normalized', 'varchar')
+            self._fill_btp_name_normalized()
+        return super()._auto_init()
+
+    @api.model
+    def _fill_btp_name_normalized(self):
+        """Store the normalized name of every company, without loading records
+
+        Names are normalized in Python (``normalize_text``), like the needles
+        of the company search, and written with one UPDATE per batch.
+        """
+        cr = self.env.cr
+        last_id = 0
+        while True:
+            cr.execute(SQL(
+                """
+                SELECT id, name
+                  FROM res_partner
+                 WHERE is_company AND name IS NOT NULL AND id > %s
+              ORDER BY id
+                 LIMIT %s
+                """,
+                last_id, NAME_NORMALIZATION_BATCH_SIZE,
+            ))
+            rows = cr.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            cr.execute(SQL(
+                """
+                UPDATE res_partner p
+                   SET btp_name_normalized = n.name
+                  FROM unnest(%s::int[], %s::varchar[]) AS n(id, name)
+                 WHERE p.id = n.id
+                """,
+                [row[0] for row in rows], [normalize_text(row[1]) or None for row in rows],
+            ))
+            _logger.info('Normalized the names of %d companies (up to id %d)', len(rows), last_id)
+
+    def init(self):
+        super().init()
+        # SIREN/SIRET uniqueness among companies, enforced by the database
+        for column in COMPANY_IDENTIFIER_FIELDS:
+            create_identifier_unique_index(
+                self.env.cr, f'res_partner_company_{column}_unique', self._table, column, where='is_company',
+            )
+            # Prefix lookups of the company search engine (LIKE '123%')
+            tools.create_index(
+                self.env.cr, f'res_partner_company_{column}_prefix_index', self._table,
+                [f'{column} varchar_pattern_ops'], where='is_company',
+            )
+        if ensure_trigram(self.env):
+            tools.create_index(
+                self.env.cr, 'res_partner_btp_name_normalized_trgm_index', self._table,
+                ['btp_name_normalized gin_trgm_ops'], method='gin', where='is_company',
+            )
+        else:
+            _logger.warning('pg_trgm extension is not available: company search will fall back to ilike scans.')
+        # Prefix lookups of names too short for trigrams (LIKE 'ab%')
+        tools.create_index(
+            self.env.cr, 'res_partner_btp_name_normalized_prefix_index', self._table,
+            ['btp_name_normalized varchar_pattern_ops'], where='is_company',
+        )
+
+    @api.depends('name', 'is_company')
+    def _compute_btp_name_normalized(self):
+        for partner in self:
+            partner.btp_name_normalized = normalize_text(partner.name) if partner.is_company else False
+
     @api.constrains('siren')
     def _check_siren(self):
         """Validate SIREN format (9 digits)"""
-        for partner in self:
-            if partner.siren and partner.is_company:
-                if not re.match(r'^\d{9}$', partner.siren):
-                    raise ValidationError(_('SIREN must be exactly 9 digits.'))
-                duplicate = self.sudo().search([
-                    ('id', '!=', partner.id),
-                    ('is_company', '=', True),
-                    ('siren', '=', partner.siren),
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(_('SIREN must be unique for companies.'))
-    
+        invalid = self.filtered(lambda p: p.siren and p.is_company and not SIREN_PATTERN.match(p.siren))
+        if invalid:
+            raise ValidationError(_(
+                'SIREN must be exactly 9 digits: %s', ', '.join(invalid.mapped('display_name'))
+            ))
+
     @api.constrains('siret')
     def _check_siret(self):
-        """Validate SIRET format (14 digits)"""
-        for partner in self:
-            if partner.siret and partner.is_company:
-                if not re.match(r'^\d{14}$', partner.siret):
-                    raise ValidationError(_('SIRET must be exactly 14 digits.'))
-                # SIRET should start with SIREN
-                if partner.siren and not partner.siret.startswith(partner.siren):
-                    raise ValidationError(_('SIRET must start with the SIREN number.'))
-                duplicate = self.sudo().search([
-                    ('id', '!=', partner.id),
-                    ('is_company', '=', True),
-                    ('siret', '=', partner.siret),
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(_('SIRET must be unique for companies.'))
-    
+        """Validate SIRET format (14 digits, starting with the SIREN)"""
+        companies = self.filtered(lambda p: p.siret and p.is_company)
+        invalid = companies.filtered(lambda p: not SIRET_PATTERN.match(p.siret))
+        if invalid:
+            raise ValidationError(_(
+                'SIRET must be exactly 14 digits: %s', ', '.join(invalid.mapped('display_name'))
+            ))
+        mismatched = companies.filtered(lambda p: p.siren and not p.siret.startswith(p.siren))
+        if mismatched:
+            raise ValidationError(_(
+                'SIRET must start with the SIREN number: %s', ', '.join(mismatched.mapped('display_name'))
+            ))
+
+    def _check_identifier_uniqueness(self, vals_list):
+        """Report every company that would share a SIREN/SIRET once stored
+
+        ``self`` holds the records being written with the single item of
+        ``vals_list``, or is empty when ``vals_list`` is being created.
+        Each identifier is checked with one query for the whole batch; the
+        partial unique indexes remain the final guarantee.
+        """
+        targets = [(record, vals_list[0]) for record in self] if self else [(self, vals) for vals in vals_list]
+        entries = {column: [] for column in COMPANY_IDENTIFIER_FIELDS}
+        for record, vals in targets:
+            if 'is_company' in vals:
+                is_company = vals['is_company']
+            elif 'company_type' in vals:
+                is_company = vals['company_type'] == 'company'
+            else:
+                is_company = record.is_company
+            if not is_company:
+                continue
+            for column, column_entries in entries.items():
+                value = vals[column] if column in vals else record[column]
+                column_entries.append((value, vals.get('name') or record.display_name, record.id))
+        for column, column_entries in entries.items():
+            check_identifier_conflicts(self, column, self._fields[column].string, column_entries, where='is_company')
+
     @api.model_create_multi
     def create(self, vals_list):
         """Override create to check for duplicates and enrich from API"""
@@ -368,43 +501,20 @@ class ResPartner(models.Model):
                 vals['parent_id'] = company.id
                 vals['company_name'] = False
 
-            # Check for company duplicates (SIREN/SIRET)
-            if vals.get('is_company') and (vals.get('siren') or vals.get('siret')):
-                duplicate = self._check_company_duplicate(vals.get('siren'), vals.get('siret'))
-                if duplicate:
-                    raise UserError(_(
-                        'Company already exists with SIREN/SIRET: %s\n'
-                        'See: %s'
-                    ) % (vals.get('siren') or vals.get('siret'), duplicate.name))
-
-            # Enrich suppliers/subcontractors from API if SIREN provided
-            if vals.get('is_company') and (vals.get('is_supplier') or vals.get('is_subcontractor')) \
-                    and vals.get('siren') and not vals.get('btp_api_enriched'):
-                enriched_data = self._enrich_from_api(vals.get('siren'))
-                if enriched_data:
-                    vals.update(enriched_data)
-                    vals['btp_api_enriched'] = True
-
             # Check for contact duplicates
             if not vals.get('is_company'):
                 incoming_phone = vals.get('phone')
                 incoming_mobile = vals.get('mobile')
                 
-                duplicate = self._check_contact_duplicate(
+                duplicate, criterion = self._find_contact_duplicate(
                     vals.get('name'),
                     vals.get('email'),
                     incoming_phone,
                     incoming_mobile
                 )
                 if duplicate:
-                    # Block exact duplicates unless forced
-                    same_email = vals.get('email') and duplicate.email and vals.get('email') == duplicate.email
-                    # Get existing phone/mobile safely
-                    existing_phone = duplicate.phone
-                    existing_mobile = duplicate.mobile
-                    same_phone = incoming_phone and existing_phone and incoming_phone == existing_phone
-                    same_mobile = incoming_mobile and existing_mobile and incoming_mobile == existing_mobile
-                    if (same_email or same_phone or same_mobile) and not vals.get('btp_force_duplicate'):
+                    # Block exact duplicates (same email or phone) unless forced
+                    if criterion in ('email', 'phone') and not vals.get('btp_force_duplicate'):
                         raise UserError(_(
                             'This contact already exists (assigned to %s). '
                             'Email/phone must be different to create a homonym. '
@@ -419,20 +529,24 @@ class ResPartner(models.Model):
                         'If email and phone are identical, an alert will be sent to management.'
                     ) % assigned_to
 
-            # Enrich company from API if SIREN provided
+            # Enrich company from API if SIREN provided, in the background (see _cron_enrich_pending)
             if vals.get('is_company') and vals.get('siren') and not vals.get('btp_api_enriched'):
-                enriched_data = self._enrich_from_api(vals.get('siren'))
-                if enriched_data:
-                    vals.update(enriched_data)
-                    vals['btp_api_enriched'] = True
+                vals.setdefault('btp_enrichment_state', 'pending')
 
             if vals.get('btp_force_duplicate'):
                 notify_candidates.append(vals)
 
+        self._check_identifier_uniqueness(vals_list)
         partners = super(ResPartner, self).create(vals_list)
+        self.env['btp.dedup.key'].sudo()._sync_records(partners, replace=False)
 
         partners._recompute_contact_duplicate_flags()
 
+        if any(partner.btp_enrichment_state == 'pending' for partner in partners):
+            cron = self.env.ref('btp_prospecting.btp_partner_enrichment_cron', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+
         # Safety: ensure assignment for companies created by salespeople
         if self.env.user.has_group('btp_prospecting.group_btp_salesperson'):
             to_assign = partners.filtered(
@@ -461,21 +575,14 @@ class ResPartner(models.Model):
             partner_phone = partner.phone
             partner_mobile = partner.mobile
             
-            duplicate = partner._check_contact_duplicate(
+            duplicate, criterion = partner._find_contact_duplicate(
                 partner.name,
                 partner.email,
                 partner_phone,
                 partner_mobile
             )
             if duplicate and duplicate.id != partner.id:
-                same_email = partner.email and duplicate.email and partner.email == duplicate.email
-                incoming_phone = partner_phone
-                incoming_mobile = partner_mobile
-                existing_phone = duplicate.phone
-                existing_mobile = duplicate.mobile
-                same_phone = incoming_phone and existing_phone and incoming_phone == existing_phone
-                same_mobile = incoming_mobile and existing_mobile and incoming_mobile == existing_mobile
-                if same_email or same_phone or same_mobile:
+                if criterion in ('email', 'phone'):
                     manager = self.env.user.manager_id
                     if manager:
                         partner.activity_schedule(
@@ -491,23 +598,28 @@ class ResPartner(models.Model):
         return partners
 
     def _recompute_contact_duplicate_flags(self):
-        """Clear duplicate flags when no duplicate exists for current values."""
-        for partner in self.filtered(lambda p: not p.is_company):
-            duplicate = partner._check_contact_duplicate(
-                partner.name,
-                partner.email,
-                partner.phone,
-                partner.mobile,
-            )
-            if not duplicate or duplicate.id == partner.id:
-                if partner.btp_duplicate_warning or partner.btp_duplicate_message:
-                    partner.sudo().with_context(skip_duplicate_recompute=True).write({
-                        'btp_duplicate_warning': False,
-                        'btp_duplicate_message': False,
-                    })
+        """Clear duplicate flags when no duplicate exists for current values.
+
+        One blocking-key self-join for the whole recordset, one write for
+        the contacts that no longer have a duplicate.
+        """
+        flagged = self.filtered(
+            lambda p: not p.is_company and (p.btp_duplicate_warning or p.btp_duplicate_message)
+        )
+        if not flagged:
+            return
+        duplicates = self.env['btp.dedup.key'].sudo()._find_matching_pairs('res.partner', flagged.ids)
+        cleared = flagged.filtered(lambda p: not duplicates.get(p.id))
+        if cleared:
+            cleared.sudo().with_context(skip_duplicate_recompute=True).write({
+                'btp_duplicate_warning': False,
+                'btp_duplicate_message': False,
+            })
     
     def write(self, vals):
         """Override write to check duplicates and handle company changes"""
+        if {'siren', 'siret', 'is_company', 'company_type'}.intersection(vals):
+            self._check_identifier_uniqueness([vals])
         if self.env.context.get('skip_career_update'):
             return super(ResPartner, self).write(vals)
 
@@ -545,11 +657,26 @@ class ResPartner(models.Model):
                     'changed_by_id': self.env.user.id,
                 })
 
-        if not self.env.context.get('skip_duplicate_recompute'):
-            self._recompute_contact_duplicate_flags()
+        # Duplicate keys and flags only depend on the contact coordinates
+        if CONTACT_DEDUP_FIELDS.intersection(vals):
+            self.env['btp.dedup.key'].sudo()._sync_records(self)
+            if not self.env.context.get('skip_duplicate_recompute'):
+                self._recompute_contact_duplicate_flags()
 
         return result
-    
+
+    def unlink(self):
+        self.env['btp.dedup.key'].sudo()._remove_records(self)
+        return super(ResPartner, self).unlink()
+
+    def _get_dedup_keys(self):
+        """Return {partner id: set of (key_type, key_value)} blocking keys (contacts only)"""
+        return {
+            partner.id: contact_dedup_keys(partner.name, partner.email, partner.phone, partner.mobile)
+            for partner in self
+            if not partner.is_company
+        }
+
     def _check_company_duplicate(self, siren=None, siret=None):
         """Check if company with same SIREN/SIRET already exists"""
         domain = [('is_company', '=', True), ('active', 'in', [True, False])]
@@ -564,29 +691,26 @@ class ResPartner(models.Model):
     
     def _check_contact_duplicate(self, name=None, email=None, phone=None, mobile=None):
         """Check if contact with same name/email/phone/mobile already exists"""
-        domain = [('is_company', '=', False), ('active', 'in', [True, False])]
-        conditions = []
-        
-        if name:
-            conditions.append([('name', '=', name)])
-        
-        if email:
-            conditions.append([('email', '=', email)])
-        
-        if phone:
-            conditions.append([('phone', '=', phone)])
+        return self._find_contact_duplicate(name, email, phone, mobile)[0]
 
-        if mobile:
-            conditions.append([('mobile', '=', mobile)])
-        
-        if not conditions:
-            return False
-        
-        # Build OR domain
-        or_domain = ['|'] * (len(conditions) - 1) + [item for sublist in conditions for item in sublist]
-        domain = domain + or_domain
-        
-        return self.sudo().search(domain, limit=1)
+    def _find_contact_duplicate(self, name=None, email=None, phone=None, mobile=None):
+        """Return (duplicate contact, matched criterion) for the given coordinates
+
+        Values are normalized (unaccented name, canonical email, E.164 phone)
+        and looked up in the ``btp.dedup.key`` blocking keys with a single
+        query, archived contacts included; email and phone matches take
+        precedence over homonyms. The current record is never reported.
+
+        :return: (res.partner (sudo) or False, 'email'/'phone'/'name' or False)
+        """
+        keys = contact_dedup_keys(name, email, phone, mobile)
+        keys = sorted(keys, key=lambda key: CONTACT_MATCH_PRIORITY.index(key[0]))
+        match = self.env['btp.dedup.key'].sudo()._find_first_match(
+            'res.partner', keys, exclude_ids=self._origin.ids,
+        )
+        if not match:
+            return False, False
+        return self.sudo().browse(match[0]), match[1]
 
     def _update_career_on_company_change(self, new_company_id, new_function=None):
         """Update career history when contact changes company"""
@@ -629,8 +753,8 @@ class ResPartner(models.Model):
         
         enriched_data = self._enrich_from_api(self.siren)
         if enriched_data:
+            enriched_data.update(btp_api_enriched=True, btp_enrichment_state='done')
             self.write(enriched_data)
-            self.btp_api_enriched = True
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
@@ -653,3 +777,158 @@ class ResPartner(models.Model):
                 }
             }
 
+    def action_refresh_from_api(self):
+        """Queue the selected companies for re-enrichment by the refresh cron"""
+        if not self.env.user.has_group('btp_prospecting.group_btp_manager'):
+            raise UserError(_('Only managers can refresh companies from API.'))
+        companies = self.filtered(lambda p: p.is_company and p.siren and p.btp_enrichment_state != 'pending')
+        companies.write({'btp_enrichment_date': False})
+        cron = self.env.ref('btp_prospecting.btp_partner_enrichment_refresh_cron', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Refresh Queued'),
+                'message': _('%s companies will be refreshed from API in the background.') % len(companies),
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+
+    @api.model
+    def _cron_enrich_pending(self):
+        """Enrich the companies queued at creation"""
+        Partner = self.sudo().with_context(active_test=False)
+        Partner._run_enrichment([('btp_enrichment_state', '=', 'pending')], 'pending')
+        return True
+
+    @api.model
+    def _cron_refresh_enrichment(self):
+        """Re-enrich the companies whose API data is older than the refresh period"""
+        refresh_days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'btp_prospecting.enrichment_refresh_days', ENRICHMENT_REFRESH_DAYS
+        ))
+        domain = [
+            ('is_company', '=', True),
+            ('siren', '!=', False),
+            ('btp_enrichment_state', '!=', 'pending'),
+            '|',
+            ('btp_enrichment_date', '=', False),
+            ('btp_enrichment_date', '<', fields.Datetime.now() - timedelta(days=refresh_days)),
+        ]
+        Partner = self.sudo().with_context(active_test=False, btp_api_cache_refresh=True)
+        Partner._run_enrichment(domain, 'refresh', fnames=ENRICHMENT_REFRESH_FIELDS)
+        return True
+
+    @api.model
+    def _run_enrichment(self, domain, label, fnames=None):
+        """Enrich the companies matching ``domain``, one batch of parallel API calls at a time
+
+        :param fnames: see ``_apply_enrichment``
+        :return: the statistics of the run, also logged with the throughput
+            and the error rate of each provider
+        """
+        max_workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'btp_prospecting.enrichment_workers', ENRICHMENT_WORKERS
+        ))
+        stats = {'processed': 0, 'changed': 0, 'unchanged': 0, 'not_found': 0, 'failed': 0, 'providers': {}}
+        started = time.monotonic()
+        remaining = self.search_count(domain)
+        last_id = 0
+        while remaining:
+            partners = self.search(domain + [('id', '>', last_id)], order='id', limit=ENRICHMENT_BATCH_SIZE)
+            if not partners:
+                break
+            partners._apply_enrichment(max_workers=max_workers, stats=stats, fnames=fnames)
+            stats['processed'] += len(partners)
+            last_id = partners[-1].id
+            remaining = max(remaining - len(partners), 0)
+            if not self.env['ir.cron']._commit_progress(len(partners), remaining=remaining):
+                break
+
+        if stats['processed']:
+            elapsed = time.monotonic() - started
+            _logger.info(
+                'Company enrichment (%s): %d companies in %.1fs (%.1f/s), %d changed, %d unchanged, '
+                '%d not found, %d failed',
+                label, stats['processed'], elapsed, stats['processed'] / (elapsed or 1),
+                stats['changed'], stats['unchanged'], stats['not_found'], stats['failed'],
+            )
+            for provider, provider_stats in stats['providers'].items():
+                if provider_stats['skipped']:
+                    _logger.info(
+                        'Company enrichment (%s): %s not configured, %d lookups skipped',
+                        label, provider, provider_stats['skipped'],
+                    )
+                if provider_stats['calls']:
+                    _logger.info(
+                        'Company enrichment (%s): %s %d calls, %d not found, %d errors (%.1f%%)',
+                        label, provider, provider_stats['calls'], provider_stats['not_found'],
+                        provider_stats['errors'], 100.0 * provider_stats['errors'] / provider_stats['calls'],
+                    )
+        return stats
+
+    def _apply_enrichment(self, max_workers=1, stats=None, fnames=None):
+        """Fetch the API data of the companies in ``self`` and store what changed
+
+        Only the fields whose value differs once converted like the field
+        stores it (e.g. truncated to its size) are written, with one write per
+        distinct change; companies unknown to the providers are flagged with
+        a single write. A change that cannot be stored (e.g. SIRET already
+        used) flags its companies failed without blocking the others.
+        Companies whose providers could not be reached are left untouched,
+        to be retried by the next run.
+
+        :param stats: optional dict incremented with the outcome counts
+        :param fnames: optional names of the only fields to update from the API data
+        """
+        stats = stats if stats is not None else {}
+        results = self.env['btp.company.api.service'].enrich_companies(
+            self.mapped('siren'), max_workers=max_workers, stats=stats.setdefault('providers', {}),
+        )
+        done = unchanged = not_found = failed = self.browse()
+        changes = defaultdict(self.browse)
+        for partner in self:
+            values, source = results[partner.siren]
+            if not source:
+                continue
+            if not values:
+                not_found |= partner
+                continue
+            if fnames is not None:
+                values = {fname: value for fname, value in values.items() if fname in fnames}
+            values.update(btp_api_source=source, btp_api_enriched=True)
+            changed = set()
+            for fname, value in values.items():
+                field = self._fields.get(fname)
+                if not field:
+                    continue
+                value = field.convert_to_record(field.convert_to_cache(value, partner), partner)
+                if partner[fname] != value:
+                    changed.add((fname, value))
+            changed = frozenset(changed)
+            done |= partner
+            if changed:
+                changes[changed] |= partner
+            else:
+                unchanged |= partner
+
+        for changed, partners in changes.items():
+            try:
+                with self.env.cr.savepoint():
+                    partners.write(dict(changed))
+            except Exception as e:
+                _logger.warning('Could not store API data of companies %s: %s', partners.ids, e)
+                done -= partners
+                failed |= partners
+
+        now = fields.Datetime.now()
+        done.write({'btp_enrichment_state': 'done', 'btp_enrichment_date': now})
+        not_found.write({'btp_enrichment_state': 'not_found', 'btp_enrichment_date': now})
+        failed.write({'btp_enrichment_state': 'failed', 'btp_enrichment_date': now})
+        for key, partners in (('changed', done - unchanged), ('unchanged', unchanged),
+                              ('not_found', not_found), ('failed', failed)):
+            stats[key] = stats.get(key, 0) + len(partners)
+
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
 
 
 class ResUsers(models.Model):
@@ -45,27 +46,49 @@ class ResUsers(models.Model):
         compute='_compute_all_subordinates',
         help='All subordinates (recursive)'
     )
+    btp_superior_link_ids = fields.One2many(
+        'btp.user.hierarchy',
+        'subordinate_id',
+        string='Hierarchy Superiors',
+        help='Direct and indirect managers (closure table)'
+    )
     
     @api.depends('subordinate_ids')
     def _compute_all_subordinates(self):
+        links = self.env['btp.user.hierarchy'].sudo().search_read(
+            [('manager_id', 'in', self.ids)], ['manager_id', 'subordinate_id'],
+        )
+        subordinate_ids = {}
+        for link in links:
+            subordinate_ids.setdefault(link['manager_id'][0], []).append(link['subordinate_id'][0])
         for user in self:
-            subordinates = user.subordinate_ids
-            # Recursively get all subordinates
-            processed = set([user.id])
-            to_process = list(user.subordinate_ids.ids)
-            
-            while to_process:
-                current_id = to_process.pop(0)
-                if current_id in processed:
-                    continue
-                processed.add(current_id)
-                current_user = self.browse(current_id)
-                if current_user.subordinate_ids:
-                    new_subordinates = current_user.subordinate_ids - subordinates
-                    subordinates |= new_subordinates
-                    to_process.extend(new_subordinates.ids)
-            
-            user.all_subordinate_ids = subordinates
+            user.all_subordinate_ids = [(6, 0, subordinate_ids.get(user.id, []))]
+
+    @api.constrains('manager_id')
+    def _check_manager_cycle(self):
+        if self._has_cycle('manager_id'):
+            raise ValidationError(_('A user cannot be their own (indirect) manager.'))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super().create(vals_list)
+        Hierarchy = self.env['btp.user.hierarchy'].sudo()
+        for user in users.filtered('manager_id'):
+            Hierarchy._move_subtree(user.id, user.manager_id.id)
+        return users
+
+    def write(self, vals):
+        result = super().write(vals)
+        if 'manager_id' in vals:
+            Hierarchy = self.env['btp.user.hierarchy'].sudo()
+            for user in self:
+                Hierarchy._move_subtree(user.id, user.manager_id.id)
+        return result
+
+    def unlink(self):
+        # Detach the subordinates through the ORM so that the hierarchy follows
+        self.subordinate_ids.filtered(lambda u: u not in self).write({'manager_id': False})
+        return super().unlink()
     
     def get_visible_lead_domain(self):
         """Get domain for leads visible to this user (pyramidal hierarchy)"""
@@ -76,10 +99,10 @@ class ResUsers(models.Model):
         # 2. Open leads (common open)
         # 3. Subordinates' leads (if manager)
         
-        domain = ['|', ('is_open', '=', True), ('user_id', '=', self.id)]
-        
-        if self.all_subordinate_ids:
-            domain = ['|'] + domain + [('user_id', 'in', self.all_subordinate_ids.ids)]
-        
-        return domain
+        return [
+            '|', '|',
+            ('is_open', '=', True),
+            ('user_id', '=', self.id),
+            ('user_id.btp_superior_link_ids.manager_id', '=', self.id),
+        ]
 
@@ -337,25 +337,18 @@ class SaleOrder(models.Model):
         followup_delay = int(self.env['ir.config_parameter'].sudo().get_param(
             'btp_prospecting.quote_followup_delay_days', 7
         ))
-        for quote in quotes:
-            if not activity_type:
-                continue
-            existing = self.env['mail.activity'].search([
-                ('res_model', '=', 'sale.order'),
-                ('res_id', '=', quote.id),
-                ('activity_type_id', '=', activity_type.id),
-                ('summary', 'ilike', 'Quote follow-up'),
-            ], limit=1)
-            if existing:
-                continue
-            self.env['mail.activity'].create({
-                'res_model': 'sale.order',
-                'res_id': quote.id,
-                'activity_type_id': activity_type.id,
-                'summary': _('Quote follow-up: %s') % (quote.btp_quote_number or quote.name),
-                'note': _('Follow up with the client for this quote.'),
-                'date_deadline': quote.btp_next_followup_date,
-                'user_id': quote.user_id.id or quote.create_uid.id,
-            })
-            quote.btp_next_followup_date = today + timedelta(days=followup_delay)
+        if not activity_type or not quotes:
+            return
+        activities = self.env['btp.activity.scheduler'].schedule([{
+            'res_model': 'sale.order',
+            'res_id': quote.id,
+            'activity_type_id': activity_type.id,
+            'summary': _('Quote follow-up: %s') % (quote.btp_quote_number or quote.name),
+            'note': _('Follow up with the client for this quote.'),
+            'date_deadline': quote.btp_next_followup_date,
+            'user_id': quote.user_id.id or quote.create_uid.id,
+            'btp_dedup_key': 'quote_followup',
+        } for quote in quotes])
+        # Quotes with a pending follow-up activity keep their follow-up date
+        self.browse(activities.mapped('res_id')).btp_next_followup_date = today + timedelta(days=followup_delay)
 
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+from . import test_company_api_transport
+from . import test_company_search_benchmark
+from . import test_lead_duplicate
+from . import test_partner_enrichment
+from . import test_sirene_importer
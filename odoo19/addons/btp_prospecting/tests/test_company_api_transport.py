@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import threading
+import time
+
+from odoo.tests import TransactionCase
+from odoo.tools import mute_logger
+from odoo.tools.lru import LRU
+
+from odoo.addons.btp_prospecting.models import btp_company_api, btp_company_api_cache
+from odoo.addons.btp_prospecting.models.btp_company_api import CircuitBreaker, TokenBucket, fetch_json
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Answer like a provider in the ``mode`` of its server: 'ok', 'error' (500) or 'timeout'"""
+
+    def do_GET(self):
+        self.server.hits += 1
+        if self.server.mode == 'timeout':
+            time.sleep(1)
+        status, body = (500, b'{}') if self.server.mode == 'error' else (200, self.server.body)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The client gave up waiting
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCompanyApiTransport(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviderHandler)
+        self.server.daemon_threads = True
+        self.server.mode = 'ok'
+        self.server.hits = 0
+        self.server.body = b'{"siren": "123456789"}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.request = (f'http://127.0.0.1:{self.server.server_port}/siren/123456789', {}, {})
+        self.bucket = TokenBucket(6000)
+
+    def _open_breaker(self, breaker):
+        for _attempt in range(breaker.failure_threshold):
+            self.assertEqual(fetch_json('insee', breaker, self.bucket, self.request), ('error', None))
+
+    @mute_logger('odoo.addons.btp_prospecting.models.btp_company_api')
+    def test_breaker_opens_on_server_errors(self):
+        self.server.mode = 'error'
+        breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+        self._open_breaker(breaker)
+        self.assertEqual(self.server.hits, 3)
+        self.assertIsNotNone(breaker.opened_at)
+
+        started = time.monotonic()
+        for _attempt in range(10):
+            self.assertEqual(fetch_json('insee', breaker, self.bucket, self.request), ('error', None))
+        self.assertLess(time.monotonic() - started, 0.1, 'An open breaker must answer without waiting')
+        self.assertEqual(self.server.hits, 3, 'An open breaker must not reach the provider')
+
+    @mute_logger('odoo.addons.btp_prospecting.models.btp_company_api')
+    def test_breaker_opens_on_timeouts(self):
+        self.server.mode = 'timeout'
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+        with patch.object(btp_company_api, 'PROVIDER_TIMEOUT', (0.5, 0.2)):
+            self._open_breaker(breaker)
+            started = time.monotonic()
+            self.assertEqual(fetch_json('insee', breaker, self.bucket, self.request), ('error', None))
+            self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(self.server.hits, 2)
+
+    @mute_logger('odoo.addons.btp_prospecting.models.btp_company_api')
+    def test_half_open_probe(self):
+        self.server.mode = 'error'
+        breaker = CircuitBreaker(failure_threshold=3, reset_seconds=0.2)
+        self._open_breaker(breaker)
+
+        # A failed probe opens the breaker again at once
+        time.sleep(0.25)
+        self.assertEqual(fetch_json('insee', breaker, self.bucket, self.request), ('error', None))
+        self.assertEqual(self.server.hits, 4)
+        self.assertEqual(fetch_json('insee', breaker, self.bucket, self.request), ('error', None))
+        self.assertEqual(self.server.hits, 4)
+
+        # A successful probe closes it
+        self.server.mode = 'ok'
+        time.sleep(0.25)
+        self.assertEqual(fetch_json('insee', breaker, self.bucket, self.request), ('ok', {'siren': '123456789'}))
+        self.assertIsNone(breaker.opened_at)
+        self.assertEqual(breaker.failures, 0)
+        self.assertEqual(fetch_json('insee', breaker, self.bucket, self.request)[0], 'ok')
+        self.assertEqual(self.server.hits, 6)
+
+    def test_token_bucket_throttles(self):
+        bucket = TokenBucket(60)
+        # Bursts are capped to a tenth of the quota, then calls are paced
+        for _attempt in range(bucket.capacity):
+            self.assertTrue(bucket.acquire(max_wait=0))
+        self.assertFalse(bucket.acquire(max_wait=0))
+        started = time.monotonic()
+        self.assertTrue(bucket.acquire(max_wait=5))
+        self.assertGreater(time.monotonic() - started, 0.5)
+
+        # A throttled call is not sent
+        breaker = CircuitBreaker()
+        with patch.object(bucket, 'acquire', return_value=False):
+            self.assertEqual(fetch_json('insee', breaker, bucket, self.request), ('error', None))
+        self.assertEqual(self.server.hits, 0)
+        self.assertFalse(breaker.trial_running)
+
+    @mute_logger('odoo.addons.btp_prospecting.models.btp_company_api')
+    def test_open_breaker_skips_provider_batch(self):
+        self.server.mode = 'error'
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+        self._open_breaker(breaker)
+        Service = self.env['btp.company.api.service']
+        with patch.object(type(Service), '_get_transport', return_value=(breaker, self.bucket)), \
+                patch.object(type(Service), '_prepare_insee_request', return_value=self.request):
+            started = time.monotonic()
+            result = Service._fetch_many('insee', [f'{index:09d}' for index in range(20)], max_workers=4)
+            self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual({status for status, _values in result.values()}, {'error'})
+        self.assertEqual(self.server.hits, 1)
+
+    @mute_logger('odoo.addons.btp_prospecting.models.btp_company_api')
+    def test_open_breaker_falls_back_to_insee(self):
+        self.env['ir.config_parameter'].sudo().set_param('btp_prospecting.pappers_api_key', 'test-key')
+        self.server.body = b'{"uniteLegale": {"siren": "987654321", "denominationUniteLegale": "STUB BTP"}}'
+        pappers_breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+        pappers_breaker.record_failure()
+        Service = self.env['btp.company.api.service']
+        with patch.dict(btp_company_api._breakers, {(self.env.cr.dbname, 'pappers'): pappers_breaker}), \
+                patch.object(btp_company_api_cache, '_memory_cache', LRU(16)), \
+                patch.object(type(Service), '_prepare_pappers_request', return_value=self.request), \
+                patch.object(type(Service), '_prepare_insee_request', return_value=self.request):
+            started = time.monotonic()
+            result = Service.enrich_companies(['987654321'], source='pappers')
+            self.assertLess(time.monotonic() - started, 0.5, 'An open Pappers breaker must not delay INSEE')
+        values, source = result['987654321']
+        self.assertEqual(source, 'insee')
+        self.assertEqual(values['name'], 'STUB BTP')
+        self.assertEqual(self.server.hits, 1, 'Only INSEE must be called')
+
+    def test_transport_per_database(self):
+        Service = self.env['btp.company.api.service']
+        breaker, bucket = Service._get_transport('insee')
+        self.assertIs(btp_company_api._breakers[(self.env.cr.dbname, 'insee')], breaker)
+        self.assertIs(btp_company_api._buckets[(self.env.cr.dbname, 'insee')], bucket)
+        self.assertNotIn('insee', btp_company_api._breakers)
+
+    def _start_of_minute(self, provider):
+        """Reset the quota of ``provider``, making sure the current minute does not end during the test"""
+        self.env.cr.execute("DELETE FROM btp_company_api_quota WHERE provider = %s", [provider])
+        _granted, wait = self.env['btp.company.api.quota']._reserve(provider, 0, 0)
+        if wait < 2:
+            time.sleep(wait + 0.1)
+
+    def test_quota_shared_by_workers(self):
+        Quota = self.env['btp.company.api.quota']
+        self._start_of_minute('infogreffe')
+        self.assertEqual(Quota._reserve('infogreffe', 25, 30)[0], 25)
+        self.assertEqual(Quota._reserve('infogreffe', 10, 30)[0], 5)
+        self.assertEqual(Quota._reserve('infogreffe', 1, 30)[0], 0)
+
+    @mute_logger('odoo.addons.btp_prospecting.models.btp_company_api')
+    def test_quota_limits_batches(self):
+        self._start_of_minute('insee')
+        # A generous bucket, so that only the shared quota of 3 calls per minute throttles
+        bucket = TokenBucket(3)
+        bucket.capacity = bucket.tokens = 10
+        Service = self.env['btp.company.api.service']
+        with patch.object(btp_company_api, 'RATE_LIMIT_MAX_WAIT', 0), \
+                patch.object(type(Service), '_get_transport', return_value=(CircuitBreaker(), bucket)), \
+                patch.object(type(Service), '_prepare_insee_request', return_value=self.request):
+            # Two workers, seen by the quota as one
+            first = Service._fetch_many('insee', ['000000001', '000000002'])
+            second = Service._fetch_many('insee', ['000000003', '000000004'])
+        self.assertEqual([status for status, _values in first.values()], ['not_found', 'not_found'])
+        self.assertEqual(sorted(status for status, _values in second.values()), ['error', 'not_found'])
+        self.assertEqual(self.server.hits, 3)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import time
+import unittest
+
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import SQL
+
+from odoo.addons.btp_prospecting.models.btp_lead_duplicate import normalize_text
+
+_logger = logging.getLogger(__name__)
+
+# Not part of the standard tests; run with --test-tags benchmark/btp_prospecting:TestCompanySearchBenchmark
+BENCHMARK_SIZE = int(os.environ.get('BTP_SEARCH_BENCHMARK_SIZE', 1000000))
+BENCHMARK_MAX_MS = float(os.environ.get('BTP_SEARCH_BENCHMARK_MAX_MS', 50))
+NAME_WORDS = (
+    'batiment', 'construction', 'travaux', 'renovation', 'maconnerie', 'charpente', 'couverture',
+    'plomberie', 'electricite', 'terrassement', 'menuiserie', 'peinture', 'isolation', 'genie',
+    'civil', 'structures', 'habitat', 'ouest', 'atlantique', 'provence',
+)
+
+
+@tagged('-standard', '-at_install', 'post_install', 'benchmark')
+class TestCompanySearchBenchmark(TransactionCase):
+    """Plans and timings of the company search engine on generated companies
+
+    ``BTP_SEARCH_BENCHMARK_SIZE`` companies are inserted with SQL, then the
+    queries of ``btp.company.search.engine`` are run with EXPLAIN ANALYZE.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not cls.registry.has_trigram:
+            raise unittest.SkipTest('pg_trgm is not available')
+        defaults = cls.env['btp.sirene.importer']._get_partner_defaults()
+        started = time.monotonic()
+        cls.env.cr.execute(SQL(
+            """
+            INSERT INTO res_partner (%(columns)s, name, btp_name_normalized, siren, siret, is_company,
+                                     create_uid, create_date, write_uid, write_date)
+            SELECT %(defaults)s n.name, n.name, s.siren, s.siren || '00012', TRUE,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM generate_series(1, %(size)s) AS i,
+                   LATERAL (SELECT '9' || lpad(i::text, 8, '0') AS siren) AS s,
+                   LATERAL (SELECT (%(words)s::varchar[])[1 + i %% %(count)s] || ' '
+                                   || (%(words)s::varchar[])[1 + (i / %(count)s) %% %(count)s] || ' '
+                                   || (%(words)s::varchar[])[1 + (i / %(count)s / %(count)s) %% %(count)s] || ' '
+                                   || substr(md5(i::text), 1, 6) AS name) AS n
+            ON CONFLICT DO NOTHING
+            """,
+            columns=SQL(", ").join(SQL.identifier(column) for column in defaults),
+            defaults=SQL("").join(SQL("%s, ", value) for value in defaults.values()),
+            uid=cls.env.uid,
+            size=BENCHMARK_SIZE,
+            words=list(NAME_WORDS),
+            count=len(NAME_WORDS),
+        ))
+        cls.env.cr.execute(SQL("ANALYZE res_partner"))
+        _logger.info('Generated %d companies in %.1fs', BENCHMARK_SIZE, time.monotonic() - started)
+
+    def _explain(self, name=None, identifier=None):
+        """Return (index names used, execution time in ms) of a company search"""
+        query = self.env['btp.company.search.engine']._get_search_query(normalize_text(name), identifier or '')
+        self.env.cr.execute(SQL("EXPLAIN (ANALYZE, FORMAT JSON) %s", query))
+        plan = self.env.cr.fetchone()[0][0]
+        indexes = set()
+        nodes = [plan['Plan']]
+        while nodes:
+            node = nodes.pop()
+            if node.get('Index Name'):
+                indexes.add(node['Index Name'])
+            nodes += node.get('Plans', [])
+        _logger.info('Company search name=%r identifier=%r: %.2f ms using %s',
+                     name, identifier, plan['Execution Time'], sorted(indexes))
+        return indexes, plan['Execution Time']
+
+    def test_identifier_prefix(self):
+        indexes, duration = self._explain(identifier='9004242')
+        self.assertIn('res_partner_company_siren_prefix_index', indexes)
+        self.assertIn('res_partner_company_siret_prefix_index', indexes)
+        self.assertLess(duration, BENCHMARK_MAX_MS)
+
+        indexes, duration = self._explain(identifier='900424240001')
+        self.assertIn('res_partner_company_siret_prefix_index', indexes)
+        self.assertLess(duration, BENCHMARK_MAX_MS)
+
+    def test_name_similarity(self):
+        self.env.cr.execute(SQL(
+            "SELECT btp_name_normalized FROM res_partner WHERE siren = %s AND is_company", '900424242',
+        ))
+        name = self.env.cr.fetchone()[0]
+        # A misspelt name still finds the company, through the trigram index
+        indexes, duration = self._explain(name=name[:-1])
+        self.assertIn('res_partner_btp_name_normalized_trgm_index', indexes)
+        self.assertLess(duration, BENCHMARK_MAX_MS)
+        companies = self.env['btp.company.search.engine'].search_companies(name=name[:-1])
+        self.assertEqual(companies[:1].siren, '900424242')
+
+    def test_short_name_prefix(self):
+        # Too short for trigrams: a prefix lookup, matching one company in twenty
+        indexes, duration = self._explain(name='ch')
+        self.assertIn('res_partner_btp_name_normalized_prefix_index', indexes)
+        self.assertLess(duration, BENCHMARK_MAX_MS)
+
+    def test_name_and_identifier(self):
+        indexes, duration = self._explain(name='charpente couverture', identifier='9001')
+        self.assertIn('res_partner_btp_name_normalized_trgm_index', indexes)
+        self.assertIn('res_partner_company_siren_prefix_index', indexes)
+        self.assertLess(duration, BENCHMARK_MAX_MS)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import TransactionCase
+
+
+class TestLeadDuplicate(TransactionCase):
+
+    def _create_lead(self, name):
+        return self.env['btp.lead'].create({
+            'name': name,
+            'site_name': 'Residence Les Tilleuls',
+            'site_zip': '44000',
+            'partner_name': 'Batiment Ouest',
+            'partner_email': 'contact@batiment-ouest.example.com',
+        })
+
+    def _assert_reported(self, lead, duplicate):
+        self.assertIn(duplicate, lead.duplicate_ids)
+        self.assertTrue(lead.message_ids.filtered(lambda message: 'Potential Duplicates Detected' in (message.body or '')))
+
+    def test_duplicates_detected_on_create(self):
+        first = self._create_lead('Fireproofing')
+        second = self._create_lead('Fireproofing, second contact')
+        self._assert_reported(second, first)
+
+    def test_duplicates_detected_by_queue(self):
+        self.env['ir.config_parameter'].sudo().set_param('btp_prospecting.duplicate_detection_deferred', 'True')
+        first = self._create_lead('Fireproofing')
+        second = self._create_lead('Fireproofing, second contact')
+        self.assertFalse(second.duplicate_ids)
+        self.env['btp.lead.duplicate.queue']._cron_process_queue()
+        self._assert_reported(second, first)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase
+
+from odoo.addons.btp_prospecting.models.res_partner import ENRICHMENT_REFRESH_FIELDS
+
+
+class TestPartnerEnrichment(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.company = self.env['res.partner'].create({
+            'name': 'Batiment Ouest (edited)',
+            'is_company': True,
+            'siren': '552100554',
+            'naf_code': '43.99',
+            'legal_form': 'SARL',
+            'city': 'Nantes',
+        })
+        self.api_values = {
+            'name': 'BATIMENT OUEST',
+            'siren': '552100554',
+            'naf_code': '43.99C',
+            'legal_form': 'SARL',
+            'city': 'Nantes',
+        }
+
+    def _apply(self, **kwargs):
+        Service = type(self.env['btp.company.api.service'])
+        results = lambda sirens, **_kwargs: {siren: (dict(self.api_values), 'insee') for siren in sirens}
+        with patch.object(Service, 'enrich_companies', side_effect=results):
+            stats = {}
+            self.company._apply_enrichment(stats=stats, **kwargs)
+        return stats
+
+    def test_values_compared_as_stored(self):
+        self.company.write({'name': 'BATIMENT OUEST', 'btp_api_source': 'insee', 'btp_api_enriched': True})
+        # The NAF code is truncated to the size of the field: nothing changed
+        stats = self._apply()
+        self.assertEqual((stats['changed'], stats['unchanged']), (0, 1))
+        self.assertEqual(self.company.naf_code, '43.99')
+        self.assertEqual(self.company.btp_enrichment_state, 'done')
+
+    def test_refresh_keeps_user_values(self):
+        self.api_values.update(legal_form='SAS', city='Saint-Herblain')
+        stats = self._apply(fnames=ENRICHMENT_REFRESH_FIELDS)
+        self.assertEqual(stats['changed'], 1)
+        self.assertEqual(self.company.name, 'Batiment Ouest (edited)')
+        self.assertEqual((self.company.legal_form, self.company.city), ('SAS', 'Saint-Herblain'))
+        self.assertEqual(self.company.btp_api_source, 'insee')
+
+        # The first enrichment stores every field
+        self._apply()
+        self.assertEqual(self.company.name, 'BATIMENT OUEST')
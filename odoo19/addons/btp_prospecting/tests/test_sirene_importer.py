@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import os
+import tempfile
+
+from odoo.exceptions import AccessError
+from odoo.tests import TransactionCase, new_test_user
+
+LEGAL_UNIT_FIELDS = [
+    'siren', 'etatAdministratifUniteLegale', 'activitePrincipaleUniteLegale', 'denominationUniteLegale',
+    'prenom1UniteLegale', 'nomUniteLegale', 'nicSiegeUniteLegale', 'categorieJuridiqueUniteLegale',
+]
+ESTABLISHMENT_FIELDS = [
+    'siret', 'etatAdministratifEtablissement', 'activitePrincipaleEtablissement', 'etablissementSiege',
+    'enseigne1Etablissement', 'numeroVoieEtablissement', 'typeVoieEtablissement', 'libelleVoieEtablissement',
+    'codePostalEtablissement', 'libelleCommuneEtablissement',
+]
+
+
+class TestSireneImporter(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.directory.cleanup)
+        cls.legal_units_path = cls._write_stock_file('StockUniteLegale.csv', LEGAL_UNIT_FIELDS, [
+            ('812345671', 'A', '43.21A', 'Electricite Ouest', '', '', '00012', '5499'),
+            ('812345672', 'A', '43.99C', '', 'Jean', 'DUPONT', '00018', '1000'),
+            # Ceased, and outside of the building divisions
+            ('812345673', 'C', '43.21A', 'Ancienne Entreprise', '', '', '00010', '5499'),
+            ('812345674', 'A', '62.01Z', 'Logiciels Ouest', '', '', '00010', '5499'),
+        ])
+        cls.establishments_path = cls._write_stock_file('StockEtablissement.csv.gz', ESTABLISHMENT_FIELDS, [
+            ('81234567100012', 'A', '43.21A', 'true', '', '12', 'RUE', 'DES LILAS', '44000', 'NANTES'),
+            ('81234567100020', 'A', '43.21A', 'false', 'Agence Rennes', '3', 'BD', 'DE LA LIBERTE', '35000', 'RENNES'),
+            # No imported company
+            ('99999999900011', 'A', '43.21A', 'true', '', '1', 'RUE', 'DU PORT', '56000', 'VANNES'),
+        ])
+        cls.Importer = cls.env['btp.sirene.importer']
+
+    @classmethod
+    def _write_stock_file(cls, name, fieldnames, rows):
+        path = os.path.join(cls.directory.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8', newline='') as stock:
+            writer = csv.writer(stock)
+            writer.writerow(fieldnames)
+            writer.writerows(rows)
+        return path
+
+    def _find_company(self, siren):
+        return self.env['res.partner'].search([('siren', '=', siren), ('is_company', '=', True)])
+
+    def test_import_legal_units(self):
+        stats = self.Importer._import_legal_units(self.legal_units_path, chunk_size=3)
+        self.assertEqual((stats['read'], stats['kept'], stats['inserted'], stats['updated']), (4, 2, 2, 0))
+        self.assertFalse(stats['interrupted'])
+        company = self._find_company('812345671')
+        self.assertEqual(company.name, 'Electricite Ouest')
+        self.assertEqual(company.siret, '81234567100012')
+        self.assertEqual(company.naf_code, '4321A')
+        self.assertEqual(self._find_company('812345672').name, 'Jean DUPONT')
+        self.assertFalse(self._find_company('812345673') | self._find_company('812345674'))
+
+        # Upserted on the SIREN, and resumable after a number of rows
+        stats = self.Importer._import_legal_units(self.legal_units_path, skip=1)
+        self.assertEqual((stats['read'], stats['inserted'], stats['updated'], stats['next_row']), (3, 0, 1, 4))
+        self.assertEqual(len(self._find_company('812345672')), 1)
+
+    def test_import_establishments(self):
+        self.Importer._import_legal_units(self.legal_units_path)
+        stats = self.Importer._import_establishments(self.establishments_path)
+        self.assertEqual((stats['read'], stats['kept'], stats['inserted']), (3, 3, 2))
+        company = self._find_company('812345671')
+        self.assertEqual((company.street, company.zip, company.city), ('12 RUE DES LILAS', '44000', 'NANTES'))
+        agency = self.env['btp.company.address'].search([('siret', '=', '81234567100020')])
+        self.assertEqual(agency.partner_id, company)
+        self.assertEqual(agency.name, 'Agence Rennes')
+        self.assertFalse(self.env['btp.company.address'].search([('siret', '=', '99999999900011')]))
+
+    def test_import_requires_administrator(self):
+        user = new_test_user(self.env, login='sirene_user', groups='base.group_user')
+        with self.assertRaises(AccessError):
+            self.Importer.with_user(user)._import_legal_units(self.legal_units_path)
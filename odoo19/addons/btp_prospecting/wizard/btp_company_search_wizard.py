@@ -14,23 +14,15 @@ class BtpCompanySearchWizard(models.TransientModel):
     def action_search(self):
         """Search companies by name or SIREN/SIRET without browsing the full base."""
         self.ensure_one()
-        Partner = self.env['res.partner'].sudo()
 
-        domain = [('is_company', '=', True)]
-        conditions = []
-
-        if self.query:
-            conditions.append([('name', 'ilike', self.query)])
-        if self.siren:
-            conditions.append([('siren', '=', self.siren)])
-            conditions.append([('siret', '=', self.siren)])
-
-        if not conditions:
+        if not self.query and not self.siren:
             self.results = _('Please provide a company name or SIREN/SIRET.')
             return {'type': 'ir.actions.act_window_close'}
 
-        or_domain = ['|'] * (len(conditions) - 1) + [item for sublist in conditions for item in sublist]
-        records = Partner.search(domain + or_domain, limit=10)
+        # Ranked: SIREN/SIRET prefix matches first, then by name similarity
+        records = self.env['btp.company.search.engine'].search_companies(
+            name=self.query, identifier=self.siren, limit=10,
+        )
 
         if not records:
             self.results = _('No matching company found.')
@@ -25,6 +25,7 @@ class BtpSupplierSearchWizard(models.TransientModel):
             'is_supplier': self.search_type == 'supplier',
             'is_subcontractor': self.search_type == 'subcontractor',
             'btp_api_enriched': True,
+            'btp_enrichment_state': 'done',
         }
         vals.update(enriched_data or {})
         return vals
@@ -37,9 +38,7 @@ class BtpSupplierSearchWizard(models.TransientModel):
 
         # Try local search by name first if provided
         if self.name:
-            existing = self.env['res.partner'].sudo().search([
-                ('name', 'ilike', self.name),
-                ('is_company', '=', True),
+            existing = self.env['btp.company.search.engine'].search_companies(name=self.name, domain=[
                 ('is_supplier', '=', self.search_type == 'supplier'),
                 ('is_subcontractor', '=', self.search_type == 'subcontractor'),
             ], limit=1)